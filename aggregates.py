@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+
+def _running_total(values):
+    # prefix sums along the year axis; index i holds the total of years[:i]
+    pad = [(0, 0)] * values.ndim
+    pad[-2] = (1, 0)
+    return np.pad(values.cumsum(axis=-2), pad)
+
+
+def top_k(values, k, largest=False):
+    """Positions of the ``k`` smallest (or largest) entries of ``values``, in
+    ascending order of value. Only the selected entries are sorted."""
+    k = min(k, len(values))
+    if k == 0:
+        return np.arange(0)
+    if largest:
+        selected = np.argpartition(values, len(values) - k)[len(values) - k:]
+    else:
+        selected = np.argpartition(values, k - 1)[:k]
+    # ties keep their order in ``values``, as a stable full sort would
+    selected.sort()
+    return selected[np.argsort(values[selected], kind='stable')]
+
+
+def rank_means(name, sums, values, by, k=5):
+    """The ``k`` lowest and ``k`` highest labels of ``sums`` (from
+    AggregateCube.label_sums, or several of them added up) by the mean of
+    ``by``, each in ascending order, as DataFrames of the label as ``name``
+    and the mean of each of ``values``. Labels without ``by`` are left out.
+    """
+    present = sums[sums[by + '_cells'].to_numpy() > 0]
+    rows = pd.DataFrame({name: present.index.to_numpy()})
+    for value in values:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rows[value] = present[value].to_numpy() / present[value + '_cells'].to_numpy()
+    means = rows[by].to_numpy()
+    return rows.iloc[top_k(means, k)], rows.iloc[top_k(means, k, largest=True)]
+
+
+class AggregateCube:
+    """Sums and counts of a wait-times table per (key, year, quarter) cell.
+
+    Running totals are kept along the year axis, so the total, count or
+    mean over any year range is the difference of two prefix sums and does
+    not depend on the number of rows in the table. With ``cell_means`` the
+    per-cell means are kept the same way, for ``ranked``.
+    """
+
+    def __init__(self, data, values, keys=('health_authority',), cell_means=False):
+        self.keys = list(keys)
+        self.values = list(values)
+        self.labels = [pd.Index(sorted(data[key].unique())) for key in self.keys]
+        self.years = np.arange(data['year'].min(), data['year'].max() + 1)
+        self.quarters = pd.Index(sorted(data['quarter'].unique()))
+
+        codes = [labels.get_indexer(data[key])
+                 for labels, key in zip(self.labels, self.keys)]
+        codes.append(data['year'].to_numpy() - self.years[0])
+        codes.append(self.quarters.get_indexer(data['quarter']))
+        self.shape = tuple(len(labels) for labels in self.labels) + \
+            (len(self.years), len(self.quarters))
+        cell = np.ravel_multi_index(codes, self.shape)
+        size = int(np.prod(self.shape))
+
+        # rows per cell, and per value the sum and number of non-missing entries
+        self.rows = np.bincount(cell, minlength=size).reshape(self.shape)
+        self.sums = {}
+        self.counts = {}
+        for value in self.values:
+            column = data[value].to_numpy(dtype='float64')
+            present = ~np.isnan(column)
+            self.sums[value] = np.bincount(
+                cell, np.where(present, column, 0), size).reshape(self.shape)
+            self.counts[value] = np.bincount(
+                cell, present, size).reshape(self.shape)
+
+        self._rows = _running_total(self.rows)
+        self._sums = {value: _running_total(s) for value, s in self.sums.items()}
+        self._counts = {value: _running_total(c)
+                        for value, c in self.counts.items()}
+        if cell_means:
+            self._cell_means = {}
+            self._cell_counts = {}
+            for value in self.values:
+                counts = self.counts[value]
+                means = self.sums[value] / np.maximum(counts, 1)
+                self._cell_means[value] = _running_total(means)
+                self._cell_counts[value] = _running_total(counts > 0)
+
+    def state(self):
+        """JSON-able metadata and the arrays ``from_state`` rebuilds the cube
+        from, for storing it outside the process."""
+        meta = {'keys': self.keys,
+                'values': self.values,
+                'labels': [labels.tolist() for labels in self.labels],
+                'years': self.years.tolist(),
+                'quarters': self.quarters.tolist(),
+                'cell_means': hasattr(self, '_cell_means')}
+        arrays = {'rows': self.rows, '_rows': self._rows}
+        for name in self._per_value(meta['cell_means']):
+            for value, array in getattr(self, name).items():
+                arrays[f'{name}.{value}'] = array
+        return meta, arrays
+
+    @staticmethod
+    def _per_value(cell_means):
+        names = ['sums', 'counts', '_sums', '_counts']
+        return names + ['_cell_means', '_cell_counts'] if cell_means else names
+
+    @classmethod
+    def from_state(cls, meta, arrays):
+        """The cube ``state`` describes, using ``arrays`` as they are (they
+        may be read-only memory maps)."""
+        cube = cls.__new__(cls)
+        cube.keys = meta['keys']
+        cube.values = meta['values']
+        cube.labels = [pd.Index(labels, dtype=object) for labels in meta['labels']]
+        cube.years = np.array(meta['years'], dtype='int64')
+        cube.quarters = pd.Index(meta['quarters'], dtype=object)
+        cube.shape = tuple(len(labels) for labels in cube.labels) + \
+            (len(cube.years), len(cube.quarters))
+        cube.rows = arrays['rows']
+        cube._rows = arrays['_rows']
+        for name in cls._per_value(meta['cell_means']):
+            setattr(cube, name, {value: arrays[f'{name}.{value}']
+                                 for value in cube.values})
+        return cube
+
+    def key_index(self, key):
+        """Position of ``key`` along the key axes, or None if it has no rows."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        index = []
+        for labels, label in zip(self.labels, key):
+            if label not in labels:
+                return None
+            index.append(labels.get_loc(label))
+        return tuple(index)
+
+    def year_slice(self, year):
+        """Positions of the inclusive ``[start, end]`` year range on the year
+        axis, clipped to the years in the data."""
+        start = int(np.clip(year[0] - self.years[0], 0, len(self.years)))
+        end = int(np.clip(year[1] - self.years[0] + 1, start, len(self.years)))
+        return start, end
+
+    def _range(self, running, key, year):
+        index = self.key_index(key)
+        if index is None:
+            return np.zeros(len(self.quarters))
+        start, end = self.year_slice(year)
+        return running[index][..., end, :] - running[index][..., start, :]
+
+    def total(self, key, year, value):
+        """Sum of ``value`` over the year range."""
+        return float(self._range(self._sums[value], key, year).sum())
+
+    def count(self, key, year, value):
+        """Number of non-missing ``value`` entries over the year range."""
+        return int(self._range(self._counts[value], key, year).sum())
+
+    def mean(self, key, year, value):
+        """Mean of the non-missing ``value`` entries over the year range."""
+        count = self.count(key, year, value)
+        if count == 0:
+            return np.nan
+        return self.total(key, year, value) / count
+
+    def cells(self, key, year):
+        """Per (year, quarter) sums over the year range, one row for every
+        cell that has data, like ``groupby([*keys, 'year', 'quarter']).sum()``."""
+        columns = self.keys + ['year', 'quarter'] + self.values
+        index = self.key_index(key)
+        if index is None:
+            return pd.DataFrame(columns=columns)
+        start, end = self.year_slice(year)
+        years, quarters = np.nonzero(self.rows[index][start:end] > 0)
+
+        cells = pd.DataFrame({'year': self.years[start:end][years],
+                              'quarter': self.quarters[quarters]})
+        for value in self.values:
+            cells[value] = self.sums[value][index][start:end][years, quarters]
+        for position, (name, labels) in enumerate(zip(self.keys, self.labels)):
+            cells.insert(position, name, labels[index[position]])
+        return cells
+
+    def ranked(self, key, year, by, k=5):
+        """The ``k`` lowest and ``k`` highest labels of the last key axis by
+        ``by``, each in ascending order.
+
+        ``key`` gives the labels of the other key axes. Values are means of
+        the per-cell means over the year range, like
+        ``groupby([*keys, 'year', 'quarter']).mean()`` followed by a mean per
+        label; labels with no data in the range are left out.
+        """
+        name = self.keys[-1]
+        if self.key_index(key) is None:
+            empty = pd.DataFrame(columns=[name] + self.values)
+            return empty, empty
+        return rank_means(name, self.label_sums(key, year), self.values, by, k)
+
+    def label_sums(self, key, year):
+        """Per label of the last key axis, the sum of its per-cell means of
+        each value over the year range and the number of cells summed (as
+        ``value + '_cells'``): what ``ranked`` averages, so the sums of
+        cubes over different years can be added up and ranked together."""
+        missing = self.key_index(key) is None
+        sums = {}
+        for value in self.values:
+            for column, running in ((value, self._cell_means[value]),
+                                    (value + '_cells', self._cell_counts[value])):
+                sums[column] = np.zeros(0) if missing else \
+                    self._range(running, key, year).sum(axis=-1)
+        return pd.DataFrame(sums, index=self.labels[-1][:0] if missing else self.labels[-1])
@@ -0,0 +1,9 @@
+// Random id of the page, sent with the dashboard updates so the server can
+// drop the ones made redundant by newer requests from the same page.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    session: {
+        new_id: function(id) {
+            return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+        }
+    }
+});
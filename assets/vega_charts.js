@@ -0,0 +1,23 @@
+// Client-side renderer for CHART_RENDERING=spec: callbacks only send the
+// Vega-Lite spec, and the vega scripts are loaded once for the whole page.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    vega: {
+        views: {},
+
+        embed: function(spec, id) {
+            var element = document.getElementById(id);
+            if (!spec || !element || typeof vegaEmbed === 'undefined') {
+                return window.dash_clientside.no_update;
+            }
+            var views = window.dash_clientside.vega.views;
+            vegaEmbed(element, JSON.parse(spec), {mode: 'vega-lite'}).then(function(result) {
+                // free the listeners and timers of the chart being replaced
+                if (views[id]) {
+                    views[id].finalize();
+                }
+                views[id] = result.view;
+            }).catch(console.error);
+            return window.dash_clientside.no_update;
+        }
+    }
+});
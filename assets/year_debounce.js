@@ -0,0 +1,31 @@
+// Debounce of the year slider: a new position is passed on to the year_range
+// Store, which the dashboard update reads, only once the slider has been
+// still for the year_debounce Interval's period. A burst of track clicks or
+// arrow-key steps then sends one request instead of one per step.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    slider: {
+        // when the slider last moved
+        moved: 0,
+
+        debounce: function(value, n_intervals, jurisdiction, current, delay) {
+            var no_update = window.dash_clientside.no_update;
+            var slider = window.dash_clientside.slider;
+            var triggered = window.dash_clientside.callback_context.triggered.map(
+                function(trigger) { return trigger.prop_id; });
+            // a new jurisdiction's range goes with it, in the same update
+            if (triggered.indexOf('jurisdiction_dropdown.value') >= 0) {
+                return [value, true];
+            }
+            // start or restart the wait
+            if (triggered.indexOf('year_slider.value') >= 0) {
+                slider.moved = Date.now();
+                return [no_update, false];
+            }
+            if (Date.now() - slider.moved < delay) {
+                return [no_update, false];
+            }
+            var same = current && current[0] === value[0] && current[1] === value[1];
+            return [same ? no_update : value, true];
+        }
+    }
+});
@@ -0,0 +1,99 @@
+"""Compare the data backends: same answers, and how fast each gives them.
+
+    python benchmarks/backends.py [--repeat 3]
+
+Runs every SurgicalPlots query the dashboard makes, for every authority,
+a spread of year ranges and every hospital, against the cube backend
+(the column store) and the SQLite one (DATA_BACKEND=sqlite), checks that
+their answers agree and prints the median time per query.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+from dash_client import import_app  # noqa: E402
+
+BACKENDS = ['cubes', 'sqlite']
+YEAR_RANGES = [[2009, 2022], [2017, 2022], [2012, 2020], [2021, 2021], [2022, 2022]]
+
+
+def queries(dash_code, plots):
+    """(query, arguments, call) for every query of the grid."""
+    for authority in dash_code.AUTHORITIES:
+        health_authority = dash_code.authority_name(authority)
+        yield 'hospitals', (health_authority,), \
+            lambda: plots.hospitals(health_authority)
+        for year in YEAR_RANGES:
+            yield 'score_cards', (health_authority, year), \
+                lambda: plots.score_cards(health_authority, year)
+            yield 'data_compprop', (health_authority, year), \
+                lambda: plots.data_compprop(year, health_authority)
+            # unrounded: filtering's rounding to 2 places can turn a last-bit
+            # difference in the order of the sums into 0.01
+            yield 'ranking', (health_authority, year), \
+                lambda: plots.data.ranked_procedures(
+                    health_authority, year, 'wait_time_90', 5)
+            for hospital in plots.hospitals(health_authority):
+                yield 'data_by_hosp', (health_authority, year, hospital), \
+                    lambda: plots.data_by_hosp(health_authority, year, hospital)
+
+
+def same(a, b):
+    if isinstance(a, pd.DataFrame):
+        if len(a) == 0 and len(b) == 0:
+            return list(a.columns) == list(b.columns)
+        a, b = a.reset_index(drop=True), b.reset_index(drop=True)
+        try:
+            pd.testing.assert_frame_equal(a, b, check_dtype=False, check_exact=False)
+        except AssertionError:
+            return False
+        return True
+    if isinstance(a, tuple):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return np.isclose(a, b, equal_nan=True)
+    return a == b
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    dash_code = import_app()
+    timings = {backend: {} for backend in BACKENDS}
+    answers = {backend: {} for backend in BACKENDS}
+    for backend in BACKENDS:
+        start = time.perf_counter()
+        plots = dash_code.SurgicalPlots(backend=backend)
+        print(f'{backend}: opened in {time.perf_counter() - start:.2f}s')
+        for name, key, call in queries(dash_code, plots):
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                answer = call()
+                seconds.append(time.perf_counter() - start)
+            answers[backend][name, repr(key)] = answer
+            timings[backend].setdefault(name, []).append(statistics.median(seconds))
+
+    differences = [key for key, answer in answers['cubes'].items()
+                   if not same(answer, answers['sqlite'][key])]
+    print(f'\n{len(answers["cubes"])} queries, {len(differences)} answers differ')
+    for name, key in differences[:10]:
+        print(f'  {name} {key}')
+
+    print(f"\n{'query':<16}{'calls':>8}" +
+          ''.join(f'{backend + " ms":>12}' for backend in BACKENDS))
+    for name in timings['cubes']:
+        print(f'{name:<16}{len(timings["cubes"][name]):>8}' +
+              ''.join(f'{statistics.median(timings[b][name]) * 1000:>12.2f}'
+                      for b in BACKENDS))
+
+
+if __name__ == '__main__':
+    main()
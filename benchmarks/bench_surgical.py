@@ -0,0 +1,243 @@
+"""Timings of the SurgicalPlots load, queries and chart rendering.
+
+    python benchmarks/bench_surgical.py --scales 1 10 100 --output bench.json
+    python benchmarks/bench_surgical.py --compare bench.json --threshold 1.25
+
+Runs offline against the workbooks in data/. Scale k replicates every
+hospital k times, which gives each authority k times the rows. Every path
+the callbacks take is timed on its own: the load, filtering, data_by_hosp,
+data_compprop, the score cards, and each chart's ``.to_html()``. Each path
+reports percentiles over all its calls. ``--compare`` exits with status 1
+when a path's median is more than ``--threshold`` times the median in an
+earlier JSON report.
+
+The queries run twice per scale: on the whole table prepared in process
+(``scale=k/``), and as the server runs them (``partitioned/scale=k/``), on
+fiscal-year partitions in a column store, here a temporary one, and a
+PartitionCache. Partitioned runs also time loading every partition from
+the store into an empty cache (``load_partitions``).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# no reload thread in a benchmark run
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+from dash_client import import_app  # noqa: E402
+
+AUTHORITIES = ['Interior', 'Fraser', 'Vancouver Coastal', 'Vancouver Island',
+               'Northern', 'Provincial Health Services Authority']
+YEARS = [[2009, 2022], [2017, 2022], [2012, 2015], [2020, 2020]]
+PERCENTILES = [50, 90, 99]
+
+
+def scale_dataset(data, factor):
+    """``data`` with every hospital repeated ``factor`` times under new names;
+    the "All Facilities" totals are kept once."""
+    if factor == 1:
+        return data
+    hospitals = list(data['hospital'].cat.categories)
+    codes = data['hospital'].cat.codes.to_numpy().astype('int64')
+    detail = (data['hospital'] != 'All Facilities').to_numpy()
+    names = hospitals + [f'{name} #{copy}' for copy in range(1, factor)
+                         for name in hospitals]
+
+    parts = [data.assign(hospital=pd.Categorical.from_codes(codes, names))]
+    for copy in range(1, factor):
+        hospital = codes[detail] + copy * len(hospitals)
+        parts.append(data[detail].assign(
+            hospital=pd.Categorical.from_codes(hospital, names)))
+    return pd.concat(parts, ignore_index=True)
+
+
+def timed(durations, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    durations.append(time.perf_counter() - start)
+    return result
+
+
+def summary(durations):
+    millis = np.asarray(durations) * 1000
+    stats = {f'p{p}': float(np.percentile(millis, p)) for p in PERCENTILES}
+    stats.update(mean=float(millis.mean()), calls=len(millis))
+    return stats
+
+
+def partitioned_plots(dash_code, store, factor):
+    """SurgicalPlots over the workbooks in data/ as the server loads them,
+    partitioned by fiscal year in ``store``, every partition scaled by
+    ``factor``."""
+    from partitions import PartitionCache, PartitionedDataset
+
+    def load_partition(store, jurisdiction, manifests, digest, year):
+        generation = f'bench-scale{factor}-{digest}-{year}'
+        return dash_code.open_data(*store.load(generation, lambda: dash_code.prepare_data(
+            scale_dataset(dash_code.load_wait_times(cache_dir=jurisdiction.cache_dir,
+                                                    year=year, manifests=manifests),
+                          factor)), digest), generation)
+
+    plots = dash_code.SurgicalPlots(store=store,
+                                    partitions=PartitionCache(dash_code.MAX_PARTITIONS))
+    if factor != 1:
+        plots.data = PartitionedDataset(plots.jurisdiction, store, plots.partitions,
+                                        load_partition)
+    return plots
+
+
+def bench_scale(dash_code, data, factor, repeat, store=None):
+    """Timings of one scale, on ``data`` prepared in process, or without
+    it as partitions in the column ``store``."""
+    results = {}
+    from map_images import AUTHORITY_IMAGES
+    from partitions import PartitionCache
+
+    durations = []
+    if store is None:
+        scaled = scale_dataset(data, factor)
+        rows = len(scaled)
+        for _ in range(max(1, repeat // 5)):
+            plots = timed(durations, dash_code.SurgicalPlots, scaled)
+        results['load'] = durations
+    else:
+        # the first load publishes the catalog and every partition, the timed
+        # ones read them back from the store as a restarted worker does
+        partitioned_plots(dash_code, store, factor).data.partitions([0, 9999])
+        for _ in range(max(1, repeat // 5)):
+            plots = timed(durations, partitioned_plots, dash_code, store, factor)
+        results['load'] = durations
+        # every year into an empty cache
+        durations = []
+        for _ in range(max(1, repeat // 5)):
+            plots.data.cache = PartitionCache(dash_code.MAX_PARTITIONS)
+            parts = timed(durations, plots.data.partitions, [0, 9999])
+        results['load_partitions'] = durations
+        rows = sum(len(part.qdata) for part in parts)
+
+    hospitals = {authority: plots.hospitals(authority)[0]
+                 for authority in AUTHORITIES}
+    inputs = [(authority, year) for authority in AUTHORITIES for year in YEARS]
+    queries = {
+        'filtering': lambda a, y: plots.filtering(a, y),
+        'data_by_hosp': lambda a, y: plots.data_by_hosp(a, y, hospitals[a]),
+        'data_compprop': lambda a, y: plots.data_compprop(y, a),
+        'score_cards': lambda a, y: plots.score_cards(a, y),
+    }
+    for name, query in queries.items():
+        durations = []
+        for _ in range(repeat):
+            for authority, year in inputs:
+                timed(durations, query, authority, year)
+        results[name] = durations
+
+    prefix = f'scale={factor}/' if store is None else f'partitioned/scale={factor}/'
+    if store is not None:
+        # rendering does not depend on where the data comes from
+        return {prefix + name: summary(durations)
+                for name, durations in results.items()}, rows
+
+    # chart objects are built once, only .to_html() is timed
+    charts = {
+        'fastest': [plots.fastest_chart(a, y) for a, y in inputs],
+        'slowest': [plots.slowest_chart(a, y) for a, y in inputs],
+        'wait_complete': [plots.wait_complete_chart(a, y, hospitals[a])
+                          for a, y in inputs],
+        'comp_prop': [plots.comp_prop_chart(y, a) for a, y in inputs],
+        'map': [dash_code.map_image_chart(a) for a in AUTHORITY_IMAGES],
+    }
+    for name, built in charts.items():
+        durations = []
+        for _ in range(repeat):
+            for chart in built:
+                timed(durations, chart.to_html)
+        results[f'to_html/{name}'] = durations
+
+    return {prefix + name: summary(durations)
+            for name, durations in results.items()}, rows
+
+
+def run(scales, repeat):
+    start = time.perf_counter()
+    dash_code = import_app()
+    import_seconds = time.perf_counter() - start
+
+    durations = []
+    for _ in range(max(1, repeat // 5)):
+        data = timed(durations, dash_code.load_wait_times)
+    results = {'load_wait_times': summary(durations)}
+
+    rows = {}
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = dash_code.ColumnStore(store_dir)
+        for factor in scales:
+            scale_results, rows[factor] = bench_scale(dash_code, data, factor, repeat)
+            results.update(scale_results)
+            scale_results, _ = bench_scale(dash_code, None, factor, repeat, store)
+            results.update(scale_results)
+
+    meta = {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'import_dash_code_s': import_seconds,
+            'rows': rows,
+            'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+
+def print_report(report):
+    print(f"{'path':<36}{'calls':>7}" + ''.join(f"{'p%d ms' % p:>11}" for p in PERCENTILES))
+    for name, stats in report['results'].items():
+        print(f'{name:<36}{stats["calls"]:>7}' +
+              ''.join(f"{stats['p%d' % p]:>11.3f}" for p in PERCENTILES))
+
+
+def compare(report, baseline, threshold):
+    """Print the median ratio to ``baseline`` per path; True if none regressed."""
+    ok = True
+    print(f"\n{'path':<36}{'base p50':>11}{'p50':>11}{'ratio':>8}")
+    for name, stats in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['p50']
+        ratio = stats['p50'] / before if before else float('inf')
+        flag = '  REGRESSION' if ratio > threshold else ''
+        ok = ok and not flag
+        print(f"{name:<36}{before:>11.3f}{stats['p50']:>11.3f}{ratio:>8.2f}{flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='passes over the inputs per path')
+    parser.add_argument('--output', help='write the report as JSON here')
+    parser.add_argument('--compare', help='JSON report to check against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='largest allowed p50 ratio with --compare')
+    args = parser.parse_args(argv)
+
+    report = run(args.scales, args.repeat)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Drive the dashboard's Dash callbacks over HTTP without a browser.
+
+Builds the same ``/_dash-update-component`` requests the Dash renderer sends,
+and follows chained callbacks the way the browser would, either in process
+with Flask's test client or over HTTP with HttpClient.
+"""
+import gzip
+import http.client
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+import brotli
+from werkzeug.wrappers import Response
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what the page starts with, see the layout in dash_code
+INITIAL_STATE = {
+    ('health_authority_buttons', 'value'): 'Interior',
+    ('year_slider', 'value'): [2017, 2022],
+    ('year_range', 'data'): [2017, 2022],
+    ('fastest_slowest_treatments_buttons', 'value'): 'Fastest',
+    ('hospital_dropdown', 'value'): [],
+    ('jurisdiction_dropdown', 'value'): 'British Columbia',
+}
+# what the page's clientside callbacks copy from one property to another,
+# done here at once: the slider's debounce (assets/year_debounce.js) ends
+# by passing its value to year_range
+CLIENTSIDE_COPIES = {('year_slider', 'value'): ('year_range', 'data')}
+
+
+def import_app():
+    """Import dash_code from the repository root, where its data paths work."""
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import dash_code
+    return dash_code
+
+
+class HttpClient:
+    """The ``get`` and ``post`` of Flask's test client over HTTP, to a server
+    running at ``base_url``, on one kept-alive connection. Not thread-safe:
+    use one per simulated browser."""
+
+    def __init__(self, base_url, timeout=60):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self._connection = None
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _send(self, method, path, body, headers):
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        self._connection.request(method, self.prefix + path, body=body,
+                                 headers=headers)
+        response = self._connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            self.close()
+        return Response(data, status=response.status, headers=response.getheaders())
+
+    def request(self, method, path, body=None, headers=None):
+        reused = self._connection is not None
+        try:
+            return self._send(method, path, body, headers or {})
+        except (OSError, http.client.HTTPException):
+            self.close()
+            if not reused:
+                raise
+        # the server closed the idle connection, try once on a new one
+        return self._send(method, path, body, headers or {})
+
+    def get(self, path, headers=None):
+        return self.request('GET', path, headers=headers)
+
+    def post(self, path, headers=None, **kwargs):
+        # the body is passed as json=, like to the test client
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return self.request('POST', path, headers=headers,
+                            body=json.dumps(kwargs['json']).encode('utf-8'))
+
+
+def _outputs(key):
+    # "..a.children...b.value.." for multi-output callbacks, "a.srcDoc" otherwise
+    multi = key.startswith('..')
+    specs = key.strip('.').split('...') if multi else [key]
+    outputs = [dict(zip(('id', 'property'), spec.rsplit('.', 1)))
+               for spec in specs]
+    return outputs if multi else outputs[0]
+
+
+def server_callbacks(app):
+    # prevent_initial_call is only in the list the browser is sent
+    initial = {entry['output']: entry.get('prevent_initial_call', False)
+               for entry in app._callback_list}
+    return {key: dict(entry, prevent_initial_call=initial.get(key, False))
+            for key, entry in app.callback_map.items() if 'callback' in entry}
+
+
+def remote_callbacks(dependencies):
+    """server_callbacks from the ``/_dash-dependencies`` list a running app
+    sends the browser, for driving it without importing it."""
+    return {entry['output']: entry for entry in dependencies
+            if not entry.get('clientside_function')}
+
+
+def callback_request(key, entry, state, changed):
+    def values(deps):
+        return [dict(dep, value=state.get((dep['id'], dep['property'])))
+                for dep in deps]
+    return {'output': key,
+            'outputs': _outputs(key),
+            'inputs': values(entry['inputs']),
+            'state': values(entry.get('state', [])),
+            'changedPropIds': [f'{id}.{prop}' for id, prop in changed]}
+
+
+def response_body(response):
+    """The body of ``response`` with any Content-Encoding undone."""
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    if encoding == 'br':
+        return brotli.decompress(response.data)
+    return response.data
+
+
+def interact(client, app, state, changes, path='/_dash-update-component',
+             headers=None, initial=False):
+    """Apply ``changes`` ({(id, prop): value}) to ``state`` and fire every
+    server callback they trigger, including chained ones.
+
+    ``app`` is the Dash app, or its server callbacks as server_callbacks or
+    remote_callbacks return them.
+
+    ``headers`` are sent with every request (Accept-Encoding, say).
+
+    ``initial`` fires the callbacks as the page load does, without those
+    that prevent their initial call.
+
+    Returns one ``(callback key, status, response bytes, seconds)`` per
+    request, the bytes as sent on the wire.
+    """
+    callbacks = app if isinstance(app, dict) else server_callbacks(app)
+    records = []
+    pending = dict(changes)
+    # triggers of the callbacks held back for others setting their inputs
+    waiting = {}
+    while pending or waiting:
+        for source, target in CLIENTSIDE_COPIES.items():
+            if source in pending:
+                pending[target] = pending[source]
+        state.update(pending)
+        changed = set(pending)
+        pending = {}
+        firing = {}
+        for key, entry in callbacks.items():
+            inputs = {(dep['id'], dep['property']) for dep in entry['inputs']}
+            triggers = (inputs & changed) | waiting.pop(key, set())
+            if triggers and not (initial and entry.get('prevent_initial_call')):
+                firing[key] = inputs, triggers
+        # like the renderer, a callback waits for the others setting its
+        # inputs and fires once, with their changes
+        produced = {}
+        for key in firing:
+            outputs = _outputs(key)
+            produced[key] = {(output['id'], output['property']) for output in
+                             (outputs if isinstance(outputs, list) else [outputs])}
+        held = {key: triggers for key, (inputs, triggers) in firing.items()
+                if any(inputs & outputs for other, outputs in produced.items()
+                       if other != key)}
+        # unless every one would wait, on each other
+        if len(held) < len(firing):
+            for key in held:
+                del firing[key]
+            waiting.update(held)
+        for key, (inputs, triggers) in firing.items():
+            entry = callbacks[key]
+            body = callback_request(key, entry, state, triggers)
+            start = time.perf_counter()
+            response = client.post(path, json=body, headers=headers or {})
+            elapsed = time.perf_counter() - start
+            records.append((key, response.status_code, len(response.data), elapsed))
+            if response.status_code != 200:
+                continue
+            data = response_body(response)
+            for id, props in json.loads(data)['response'].items():
+                for prop, value in props.items():
+                    # like the renderer, a callback is not fired again by
+                    # outputs that are also its own inputs
+                    if state.get((id, prop)) != value:
+                        state[(id, prop)] = value
+                        if (id, prop) not in inputs:
+                            pending[(id, prop)] = value
+        # the callbacks chained to the first ones fire on the page load too
+        initial = False
+    return records
+
+
+def initial_load(client, app, **kwargs):
+    """Fire every server callback once, as the page does when it loads."""
+    state = dict(INITIAL_STATE)
+    return state, interact(client, app, state, dict(INITIAL_STATE), initial=True,
+                           **kwargs)
@@ -0,0 +1,334 @@
+"""Concurrent users replaying dashboard sessions against a running server.
+
+    python benchmarks/load_test.py benchmarks/scenarios/morning_rush.json \\
+        --url http://127.0.0.1:8000 [--users 50] [--duration 60]
+    python benchmarks/load_test.py benchmarks/scenarios/slider_drag.json \\
+        --gunicorn 1x4 --gunicorn 2x2 --gunicorn 4x1
+    python benchmarks/load_test.py --compare load_reports/*.json
+
+Each simulated user runs in a thread with its own kept-alive connection
+and, until the duration is up, loads the page (the index, layout and
+dependencies GETs and the page-load callback) and plays one of the
+scenario's sessions, picked by weight, pausing a random think time between
+steps. Callbacks are found from the server's ``/_dash-dependencies``, so
+nothing is imported from the app. Users start spread over ``--ramp-up``.
+
+With ``--gunicorn WORKERSxTHREADS`` (repeatable) each configuration is
+started in turn with gunicorn.conf.py on a free local port and measured;
+``--url`` measures a server that is already running. Every run is saved as
+a JSON report in ``--reports`` and runs are printed side by side, as are
+saved reports with ``--compare``.
+
+A scenario is a JSON file::
+
+    {"name": "...", "description": "...",
+     "think_time": [min_seconds, max_seconds],
+     "sessions": [{"name": "...", "weight": 3, "steps": [...]}]}
+
+where each step is one of ``{"authority": "Fraser"}``, ``{"years": [2012,
+2020]}``, ``{"pace": "Slowest"}``, ``{"hospital": "..."}`` (``null`` for
+any hospital in the dropdown), or ``{"drag": [[2016, 2022], [2015, 2022]],
+"interval": 0.05}``: year slider positions sent ``interval`` seconds apart
+without waiting for the answers, as stepping the slider does. A list of
+authorities or paces picks one at random.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+from dash_client import (INITIAL_STATE, ROOT, HttpClient, interact,
+                         remote_callbacks, response_body)
+
+PAGE = ['/', '/_dash-layout', '/_dash-dependencies']
+STEP_PROPS = {
+    'authority': ('health_authority_buttons', 'value'),
+    'years': ('year_slider', 'value'),
+    'pace': ('fastest_slowest_treatments_buttons', 'value'),
+    'hospital': ('hospital_dropdown', 'value'),
+}
+PERCENTILES = [50, 90, 95, 99]
+
+
+def load_scenario(path):
+    with open(path) as f:
+        scenario = json.load(f)
+    for session in scenario['sessions']:
+        for step in session['steps']:
+            kinds = set(step) - {'interval'}
+            if len(kinds) != 1 or not kinds <= set(STEP_PROPS) | {'drag'}:
+                raise ValueError(f'{path}: unknown step {step}')
+    return scenario
+
+
+class User:
+    """One simulated browser: page loads and scenario sessions until
+    ``deadline``, each request appended to ``records`` as ``(step, status,
+    seconds)`` with status None for a failed connection."""
+
+    def __init__(self, base_url, scenario, deadline, records, seed):
+        self.base_url = base_url
+        self.scenario = scenario
+        self.deadline = deadline
+        self.records = records
+        self.random = random.Random(seed)
+        self.client = HttpClient(base_url)
+
+    def record(self, step, results):
+        self.records.extend((step, status, seconds)
+                            for _, status, _, seconds in results)
+
+    def think(self):
+        time.sleep(self.random.uniform(*self.scenario['think_time']))
+
+    def page_load(self):
+        results = []
+        for path in PAGE:
+            start = time.perf_counter()
+            response = self.client.get(path)
+            results.append((path, response.status_code, 0,
+                            time.perf_counter() - start))
+        self.record('page load', results)
+        callbacks = remote_callbacks(json.loads(response_body(response)))
+        # the page's id, as assets/page_session.js sets it
+        state = dict(INITIAL_STATE)
+        state[('page_session', 'data')] = uuid.uuid4().hex
+        self.record('page load', interact(self.client, callbacks, state,
+                                          dict(INITIAL_STATE), initial=True))
+        return callbacks, state
+
+    def step(self, callbacks, state, step):
+        if 'drag' in step:
+            self.drag(callbacks, state, step['drag'], step.get('interval', 0.05))
+            return
+        (kind, value), = step.items()
+        if kind == 'hospital' and value is None:
+            options = state.get(('hospital_dropdown', 'options')) or [{'value': None}]
+            value = self.random.choice(options)['value']
+        elif isinstance(value, list) and kind != 'years':
+            value = self.random.choice(value)
+        self.record(kind, interact(self.client, callbacks, state,
+                                   {STEP_PROPS[kind]: value}))
+
+    def drag(self, callbacks, state, positions, interval):
+        # every position on its own connection, like the browser's parallel
+        # requests; the page keeps the state of the last one
+        states = [dict(state) for _ in positions]
+
+        def send(position, year):
+            try:
+                self.record('drag', interact(HttpClient(self.base_url), callbacks,
+                                             states[position],
+                                             {STEP_PROPS['years']: year}))
+            except (OSError, ValueError, http.client.HTTPException):
+                self.records.append(('drag', None, 0))
+
+        threads = []
+        for position, year in enumerate(positions):
+            threads.append(threading.Thread(target=send, args=(position, year)))
+            threads[-1].start()
+            time.sleep(interval)
+        for thread in threads:
+            thread.join()
+        state.update(states[-1])
+
+    def run(self):
+        sessions = self.scenario['sessions']
+        weights = [session.get('weight', 1) for session in sessions]
+        while time.monotonic() < self.deadline:
+            session = self.random.choices(sessions, weights)[0]
+            try:
+                callbacks, state = self.page_load()
+                for step in session['steps']:
+                    if time.monotonic() >= self.deadline:
+                        break
+                    self.think()
+                    self.step(callbacks, state, step)
+            except (OSError, ValueError, http.client.HTTPException):
+                # a refused or dropped connection, or a broken response:
+                # count it and start a new visit
+                self.records.append(('failed visit', None, 0))
+                self.client.close()
+                time.sleep(1)
+            self.think()
+
+
+def summarize(records):
+    seconds = np.array([s for _, status, s in records if status is not None])
+    errors = sum(1 for _, status, _ in records
+                 if status is None or status >= 400)
+    summary = {'requests': len(records), 'errors': errors,
+               # answered without an update, e.g. dropped as superseded
+               'no_update': sum(1 for _, status, _ in records if status == 204)}
+    if len(seconds):
+        for p, value in zip(PERCENTILES, np.percentile(seconds, PERCENTILES)):
+            summary[f'p{p}_ms'] = round(float(value) * 1000, 1)
+        summary['max_ms'] = round(float(seconds.max()) * 1000, 1)
+    return summary
+
+
+def load_test(base_url, scenario, users, duration, ramp_up=0, seed=0):
+    records = []
+    start = time.monotonic()
+    deadline = start + ramp_up + duration
+    threads = []
+    for i in range(users):
+        user = User(base_url, scenario, deadline, records, seed + i)
+        thread = threading.Thread(target=user.run, daemon=True)
+        threads.append(thread)
+        thread.start()
+        time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    overall = summarize(records)
+    overall['throughput'] = round(overall['requests'] / elapsed, 2)
+    overall['error_rate'] = round(overall['errors'] / max(overall['requests'], 1), 4)
+    steps = sorted({step for step, _, _ in records})
+    return {'scenario': scenario['name'], 'users': users, 'duration': duration,
+            'ramp_up': ramp_up, 'seconds': round(elapsed, 1),
+            'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'overall': overall,
+            'steps': {step: summarize([r for r in records if r[0] == step])
+                      for step in steps}}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, threads, port, timeout=300):
+    """Start the app under gunicorn and wait until it answers."""
+    command = [shutil.which('gunicorn'), 'dash_code:server',
+               '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, cwd=ROOT)
+    client = HttpClient(f'http://127.0.0.1:{port}')
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {process.returncode}')
+        try:
+            if client.get('/').status_code == 200:
+                client.close()
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.send_signal(signal.SIGTERM)
+    raise RuntimeError(f'gunicorn did not answer within {timeout}s')
+
+
+def save(report, directory):
+    os.makedirs(directory, exist_ok=True)
+    stamp = report['started'].replace(':', '').replace('-', '')
+    path = os.path.join(directory, f"{report['scenario']}-{report['label']}-{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def print_reports(reports):
+    columns = ['users', 'req/s', 'errors %', 'p50 ms', 'p95 ms', 'p99 ms',
+               'max ms', '204s']
+    print(f"{'scenario':<16}{'server':<14}" + ''.join(f'{c:>10}' for c in columns))
+    for report in reports:
+        overall = report['overall']
+        values = [report['users'], overall['throughput'],
+                  round(overall['error_rate'] * 100, 2),
+                  overall.get('p50_ms'), overall.get('p95_ms'),
+                  overall.get('p99_ms'), overall.get('max_ms'),
+                  overall['no_update']]
+        print(f"{report['scenario']:<16}{report['label']:<14}" +
+              ''.join(f'{str(v):>10}' for v in values))
+    for report in reports:
+        print(f"\n{report['scenario']} on {report['label']}, by step:")
+        print(f"{'step':<16}{'requests':>10}{'errors':>10}{'p50 ms':>10}"
+              f"{'p95 ms':>10}{'p99 ms':>10}")
+        for step, summary in report['steps'].items():
+            print(f"{step:<16}{summary['requests']:>10}{summary['errors']:>10}"
+                  f"{str(summary.get('p50_ms')):>10}{str(summary.get('p95_ms')):>10}"
+                  f"{str(summary.get('p99_ms')):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', nargs='?', help='scenario JSON file')
+    parser.add_argument('--url', help='server to test, already running')
+    parser.add_argument('--label', help='name of the --url server in reports')
+    parser.add_argument('--gunicorn', action='append', default=[],
+                        metavar='WORKERSxTHREADS',
+                        help='start and test this gunicorn configuration')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60,
+                        help='seconds to run after the ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=10,
+                        help='seconds over which users start')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reports', default='load_reports',
+                        help='directory the JSON reports are saved in')
+    parser.add_argument('--compare', nargs='+', metavar='REPORT',
+                        help='print saved reports side by side and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        print_reports(reports)
+        return 0
+    if not args.scenario or bool(args.url) == bool(args.gunicorn):
+        parser.error('give a scenario and either --url or --gunicorn')
+    if args.gunicorn and not shutil.which('gunicorn'):
+        parser.error('gunicorn is not installed; start a server and use --url')
+    scenario = load_scenario(args.scenario)
+
+    targets = []
+    if args.url:
+        targets.append((args.label or 'url', None))
+    for config in args.gunicorn:
+        workers, threads = (int(n) for n in config.lower().split('x'))
+        targets.append((f'{workers}x{threads}', (workers, threads)))
+
+    reports = []
+    for label, config in targets:
+        process = None
+        if config:
+            port = free_port()
+            process = start_gunicorn(*config, port)
+            url = f'http://127.0.0.1:{port}'
+        else:
+            url = args.url
+        try:
+            report = load_test(url, scenario, args.users, args.duration,
+                               args.ramp_up, args.seed)
+        finally:
+            if process:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+        report['label'] = label
+        if config:
+            report['workers'], report['threads'] = config
+        print(f'saved {save(report, args.reports)}', file=sys.stderr)
+        reports.append(report)
+    print_reports(reports)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
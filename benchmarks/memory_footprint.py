@@ -0,0 +1,81 @@
+"""Per-worker memory held by the loaded wait-times data.
+
+    python benchmarks/memory_footprint.py
+
+Prints the memory added by importing dash_code (on top of the libraries it
+uses), then by the page-load view and by a query over every year, which
+load the fiscal-year partitions they touch. For each loaded partition the
+deep size of its tables is listed, marking the tables that are views
+sharing its qdata's memory and those read from the column store's memory
+maps. Mapped pages count towards the resident set but are shared by every
+worker; the anonymous memory (heap) is what each worker adds on its own.
+"""
+import gc
+
+import numpy as np
+
+
+def memory():
+    # resident and anonymous bytes of this process, Linux only
+    sizes = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                sizes[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return sizes['Rss'], sizes['Anonymous']
+
+
+def mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def main():
+    import altair, dash, dash_bootstrap_components, numpy, pandas  # noqa: F401
+    from dash_client import import_app
+
+    gc.collect()
+    before = memory()
+    dash_code = import_app()
+    plots = dash_code.surgical_plots
+    steps = [('import', None),
+             ('page-load view', lambda: plots.score_cards(
+                 dash_code.authority_name(dash_code.DEFAULT_AUTHORITY),
+                 dash_code.DEFAULT_YEARS)),
+             ('every year', lambda: plots.score_cards(
+                 dash_code.authority_name(dash_code.DEFAULT_AUTHORITY), [0, 9999]))]
+    added = []
+    for step, query in steps:
+        if query:
+            query()
+        gc.collect()
+        after = memory()
+        added.append((step, after[0] - before[0], after[1] - before[1],
+                      plots.partitions.stats()['resident']))
+
+    print(f"{'table':<48}{'rows':>10}{'MiB':>10}  view of qdata  mapped")
+    for digest, year in plots.partitions.keys():
+        data = plots.partitions.get((digest, year), None)
+        core = data.qdata['waiting'].to_numpy()
+        tables = [('qdata', data.qdata), ('count', data.count)]
+        for authority, rows in data.authority_rows.items():
+            tables.append((f'no_cataract {authority}', rows.no_cataract))
+        for name, frame in tables:
+            size = frame.memory_usage(index=True, deep=True).sum()
+            values = frame['waiting'].to_numpy()
+            view = name != 'qdata' and np.shares_memory(values, core)
+            print(f'{year} {name:<43}{len(frame):>10,}{size / 2**20:>10.1f}  '
+                  f'{str(view):<14}{mapped(values)}')
+
+    print(f"\n{'worker memory added after':<28}{'partitions':>12}"
+          f"{'RSS MiB':>10}{'anon MiB':>10}")
+    for step, rss, anonymous, resident in added:
+        print(f'{step:<28}{resident:>12}{rss / 2**20:>10.1f}{anonymous / 2**20:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
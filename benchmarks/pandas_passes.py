@@ -0,0 +1,108 @@
+"""Count the pandas passes each dashboard interaction costs.
+
+    python benchmarks/pandas_passes.py [--max-passes N]
+
+Replays a page load and a few clicks through the Dash callbacks and counts
+DataFrame.groupby calls and boolean row filters of DataFrames made while
+answering them. Exits with status 1 if any interaction makes more than
+``--max-passes`` of them (MAX_PASSES by default, the budget
+tests/test_pandas_passes.py holds the callbacks to).
+"""
+import argparse
+import functools
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+from dash_client import import_app, initial_load, interact  # noqa: E402
+
+INTERACTIONS = [
+    ('authority', {('health_authority_buttons', 'value'): 'Fraser'}),
+    ('year range', {('year_slider', 'value'): [2012, 2020]}),
+    ('pace', {('fastest_slowest_treatments_buttons', 'value'): 'Slowest'}),
+    ('hospital', {('hospital_dropdown', 'value'): 'Surrey Memorial Hospital'}),
+    ('authority', {('health_authority_buttons', 'value'): 'Provincial'}),
+]
+# the most groupbys and filters together one interaction may make
+MAX_PASSES = 4
+
+counts = {'groupby': 0, 'filter': 0}
+
+
+def _counting(name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        counts[name] += 1
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _boolean_key(key):
+    return (isinstance(key, (pd.Series, np.ndarray))
+            and getattr(key, 'dtype', None) == bool)
+
+
+def install():
+    """Count DataFrame groupbys and boolean filters in ``counts`` until the
+    returned function is called."""
+    groupby = pd.DataFrame.groupby
+    getitem = pd.DataFrame.__getitem__
+    pd.DataFrame.groupby = _counting('groupby', groupby)
+
+    @functools.wraps(getitem)
+    def counted_getitem(self, key):
+        if _boolean_key(key):
+            counts['filter'] += 1
+        return getitem(self, key)
+    pd.DataFrame.__getitem__ = counted_getitem
+
+    def uninstall():
+        pd.DataFrame.groupby = groupby
+        pd.DataFrame.__getitem__ = getitem
+    return uninstall
+
+
+def replay(dash_code):
+    """``(interaction, requests, groupbys, filters)`` of a page load and
+    then of each of INTERACTIONS."""
+    client = dash_code.server.test_client()
+    # charts rendered for the layout would hide the cost of a first click
+    dash_code.surgical_plots.charts.clear()
+    uninstall = install()
+    try:
+        rows = []
+        state = None
+        for name, changes in [('page load', None)] + INTERACTIONS:
+            counts.update(groupby=0, filter=0)
+            if state is None:
+                state, records = initial_load(client, dash_code.app)
+            else:
+                records = interact(client, dash_code.app, state, changes)
+            rows.append((name, len(records), counts['groupby'], counts['filter']))
+        return rows
+    finally:
+        uninstall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-passes', type=int, default=MAX_PASSES)
+    args = parser.parse_args(argv)
+
+    worst = 0
+    print(f"{'interaction':<14}{'requests':>10}{'groupby':>10}{'filters':>10}")
+    for name, requests, groupbys, filters in replay(import_app()):
+        worst = max(worst, groupbys + filters)
+        print(f"{name:<14}{requests:>10}{groupbys:>10}{filters:>10}")
+
+    if worst > args.max_passes:
+        print(f'an interaction made {worst} passes, more than {args.max_passes}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
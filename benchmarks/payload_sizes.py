@@ -0,0 +1,64 @@
+"""Bytes sent per callback for each chart rendering mode.
+
+    python benchmarks/payload_sizes.py
+
+Replays the same interactions against the app once per CHART_RENDERING
+mode (each in its own process, since the mode is read at import) and
+prints the response size of every callback.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from dash_client import import_app, initial_load, interact
+
+MODES = ['html', 'spec']
+INTERACTIONS = [
+    {('health_authority_buttons', 'value'): 'Fraser'},
+    {('year_slider', 'value'): [2012, 2020]},
+    {('fastest_slowest_treatments_buttons', 'value'): 'Slowest'},
+    {('health_authority_buttons', 'value'): 'Provincial'},
+    {('year_slider', 'value'): [2009, 2022]},
+]
+
+
+def measure():
+    dash_code = import_app()
+    client = dash_code.server.test_client()
+    state, records = initial_load(client, dash_code.app)
+    for changes in INTERACTIONS:
+        records += interact(client, dash_code.app, state, changes)
+
+    # name chart callbacks by chart id so both modes line up
+    sizes = defaultdict(list)
+    for key, _, size, _ in records:
+        sizes[key.replace('_spec.data', '').replace('.srcDoc', '')].append(size)
+    return {key: sum(values) / len(values) for key, values in sizes.items()}, \
+        sum(size for _, _, size, _ in records) / (len(INTERACTIONS) + 1)
+
+
+def main():
+    results = {}
+    for mode in MODES:
+        env = dict(os.environ, CHART_RENDERING=mode)
+        output = subprocess.run([sys.executable, __file__, '--child'], env=env,
+                                check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.splitlines()[-1])
+
+    keys = sorted({key for mode in MODES for key in results[mode]['callbacks']})
+    print(f"{'mean bytes per callback':<60}" + ''.join(f'{mode:>12}' for mode in MODES))
+    for key in keys:
+        print(f'{key[:59]:<60}' + ''.join(
+            f"{results[mode]['callbacks'].get(key, 0):>12,.0f}" for mode in MODES))
+    print(f"{'mean bytes per interaction':<60}" + ''.join(
+        f"{results[mode]['per_interaction']:>12,.0f}" for mode in MODES))
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        callbacks, per_interaction = measure()
+        print(json.dumps({'callbacks': callbacks, 'per_interaction': per_interaction}))
+    else:
+        main()
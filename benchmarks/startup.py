@@ -0,0 +1,91 @@
+"""Worker start-up: import time and time to the first response.
+
+    python benchmarks/startup.py [--runs 5]
+
+Each run starts a fresh interpreter and times ``import dash_code``, then the
+first page load (the index, layout and dependencies GETs and the page-load
+callback). The preload rows do what gunicorn.conf.py has the master do,
+the import and ``warm_up``, then fork a worker and time its first page
+load; its start-up is the master's time plus the fork. Medians over the
+runs are printed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+
+PAGE = ['/', '/_dash-layout', '/_dash-dependencies']
+
+
+def first_page_load(dash_code):
+    from dash_client import initial_load
+    start = time.perf_counter()
+    client = dash_code.server.test_client()
+    for path in PAGE:
+        assert client.get(path).status_code == 200, path
+    _, records = initial_load(client, dash_code.app)
+    assert all(status == 200 for _, status, _, _ in records), records
+    return time.perf_counter() - start
+
+
+def child(preload):
+    start = time.perf_counter()
+    from dash_client import import_app
+    dash_code = import_app()
+    imported = time.perf_counter() - start
+    if not preload:
+        return {'import': imported, 'first response': first_page_load(dash_code)}
+
+    dash_code.warm_up()
+    imported = time.perf_counter() - start
+
+    # a forked worker reports back over a pipe
+    read, write = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        seconds = time.perf_counter() - forked
+        result = {'fork': seconds, 'first response': first_page_load(dash_code)}
+        os.write(write, json.dumps(result).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        result = json.loads(f.read())
+    os.waitpid(pid, 0)
+    return {'import': imported, 'worker start': imported + result['fork'],
+            'first response': result['first response']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', choices=['plain', 'preload'])
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child == 'preload')))
+        return 0
+
+    print(f"{'mode':<10}{'timing':<16}{'median s':>10}{'min s':>10}")
+    for mode in ['plain', 'preload']:
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode], check=True,
+                capture_output=True, text=True).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        for timing in runs[0]:
+            values = [run[timing] for run in runs]
+            print(f'{mode:<10}{timing:<16}{statistics.median(values):>10.3f}'
+                  f'{min(values):>10.3f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
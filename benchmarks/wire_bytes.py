@@ -0,0 +1,81 @@
+"""Bytes on the wire per interaction, by response encoding.
+
+    python benchmarks/wire_bytes.py
+
+Loads the page (the index, layout and dependencies GETs plus the initial
+callbacks) and replays a few interactions once per Accept-Encoding. The
+same session is then replayed with the ETags of its GETs, as a browser
+that keeps them would, to count the 304s and the bytes they save (callback
+POSTs are always sent in full).
+"""
+import os
+
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+from dash_client import import_app, initial_load, interact  # noqa: E402
+
+ENCODINGS = ['identity', 'gzip', 'br']
+PAGE = ['/', '/_dash-layout', '/_dash-dependencies']
+INTERACTIONS = [
+    ('authority', {('health_authority_buttons', 'value'): 'Fraser'}),
+    ('year range', {('year_slider', 'value'): [2012, 2020]}),
+    ('pace', {('fastest_slowest_treatments_buttons', 'value'): 'Slowest'}),
+    ('hospital', {('hospital_dropdown', 'value'): 'Surrey Memorial Hospital'}),
+    ('authority', {('health_authority_buttons', 'value'): 'Provincial'}),
+]
+
+
+def page_load(client, headers, etags):
+    records = []
+    for path in PAGE:
+        request_headers = dict(headers)
+        if path in etags:
+            request_headers['If-None-Match'] = f'"{etags[path]}"'
+        response = client.get(path, headers=request_headers)
+        if response.get_etag()[0]:
+            etags[path] = response.get_etag()[0]
+        records.append((path, response.status_code, len(response.data), 0))
+    return records
+
+
+def session(client, app, headers, etags=None):
+    """(name, records) per step of one visit."""
+    state, records = initial_load(client, app, headers=headers)
+    steps = [('page load', page_load(client, headers, {} if etags is None else etags)
+              + records)]
+    for name, changes in INTERACTIONS:
+        steps.append((name, interact(client, app, state, changes, headers=headers)))
+    return steps
+
+
+def total(records):
+    return sum(size for _, _, size, _ in records)
+
+
+def main():
+    dash_code = import_app()
+    client = dash_code.server.test_client()
+
+    columns = {encoding: session(client, dash_code.app,
+                                 {'Accept-Encoding': encoding})
+               for encoding in ENCODINGS}
+    print(f"{'interaction':<14}" + ''.join(f'{e:>12}' for e in ENCODINGS))
+    for i, (name, _) in enumerate(columns[ENCODINGS[0]]):
+        print(f'{name:<14}' + ''.join(f'{total(columns[e][i][1]):>12}'
+                                      for e in ENCODINGS))
+    print(f"{'total':<14}" + ''.join(
+        f'{sum(total(r) for _, r in columns[e]):>12}' for e in ENCODINGS))
+
+    # a second visit with the ETags of the first
+    headers = {'Accept-Encoding': 'br'}
+    etags = {}
+    first = session(client, dash_code.app, headers, etags)
+    again = session(client, dash_code.app, headers, etags)
+    responses = [record for _, records in again for record in records]
+    not_modified = sum(1 for _, status, _, _ in responses if status == 304)
+    print(f'\nrepeat visit (br, with ETags): {not_modified} of {len(responses)} '
+          f'responses were 304, {sum(total(r) for _, r in again)} bytes '
+          f'against {sum(total(r) for _, r in first)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+
+from render_cache import RenderCache
+
+BUNDLE_VERSION = 1
+INDEX_FILE = 'index.json'
+CHART_DIR = 'charts'
+EXTENSIONS = {'html': '.html', 'spec': '.json'}
+
+
+def bundle_key(kind, *args):
+    """Index key of a chart or score card, e.g. "fastest|Fraser|2012|2020"."""
+    parts = [kind]
+    for arg in args:
+        parts.extend(arg if isinstance(arg, (list, tuple)) else [arg])
+    return '|'.join(str(part) for part in parts)
+
+
+def _write_atomic(target, data):
+    # write next to the target and rename so readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def write_chart(bundle_dir, content, rendering):
+    """Store ``content`` under its content hash; returns the file name.
+
+    Identical charts, such as year ranges past the end of the data, are
+    stored once.
+    """
+    data = content.encode('utf-8')
+    name = hashlib.sha256(data).hexdigest()[:16] + EXTENSIONS[rendering]
+    target = os.path.join(bundle_dir, CHART_DIR, name)
+    if not os.path.exists(target):
+        _write_atomic(target, data)
+    return name
+
+
+def write_index(bundle_dir, index):
+    _write_atomic(os.path.join(bundle_dir, INDEX_FILE),
+                  json.dumps(dict(index, version=BUNDLE_VERSION)).encode('utf-8'))
+
+
+class ChartBundle:
+    """The dashboard's charts, score cards and hospital lists as written by
+    prerender.py, answered from the bundle's index instead of the data.
+
+    Has the methods of SurgicalPlots the callbacks use, with the same
+    arguments, plus ``map_image_plot``. Chart files are read on first use
+    and kept in ``charts``.
+    """
+
+    def __init__(self, bundle_dir, rendering=None):
+        self.bundle_dir = bundle_dir
+        self.rendering = rendering
+        self.charts = RenderCache()
+        self.load_index()
+
+    def load_index(self):
+        with open(os.path.join(self.bundle_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+        if index.get('version') != BUNDLE_VERSION:
+            raise ValueError(f'{self.bundle_dir} is a version '
+                             f'{index.get("version")} bundle, not {BUNDLE_VERSION}')
+        if self.rendering and index['rendering'] != self.rendering:
+            raise ValueError(f'{self.bundle_dir} holds {index["rendering"]} '
+                             f'charts, not {self.rendering}')
+        self.index = index
+
+    # re-read the index, for a bundle rebuilt in place
+    def reload(self):
+        self.load_index()
+        self.charts.clear()
+
+    # this bundle with its current index, as SurgicalPlots.snapshot; charts
+    # are cached by file name, the hash of their contents, so stay shared
+    def snapshot(self):
+        return copy.copy(self)
+
+    def _lookup(self, table, kind, *args):
+        key = bundle_key(kind, *args)
+        try:
+            return self.index[table][key]
+        except KeyError:
+            raise KeyError(f'{key} is not in the bundle at {self.bundle_dir}') from None
+
+    def _read(self, name):
+        with open(os.path.join(self.bundle_dir, CHART_DIR, name), encoding='utf-8') as f:
+            return f.read()
+
+    def _chart(self, kind, *args):
+        name = self._lookup('charts', kind, *args)
+        return self.charts.get_or_render(name, lambda: self._read(name))
+
+    def hospitals(self, health_authority):
+        return self.index['hospitals'].get(health_authority, [])
+
+    def score_cards(self, health_authority, year):
+        return tuple(self._lookup('score_cards', 'cards', health_authority, year))
+
+    def fastest_procedures(self, health_authority, year):
+        return self._chart('fastest', health_authority, year)
+
+    def slowest_procedures(self, health_authority, year):
+        return self._chart('slowest', health_authority, year)
+
+    def wait_complete_plot(self, health_authority, year, hospname):
+        return self._chart('wait_complete', health_authority, year, hospname)
+
+    def comp_prop_plot(self, year, health_authority):
+        return self._chart('comp_prop', health_authority, year)
+
+    def map_image_plot(self, authority):
+        return self._chart('map', authority)
@@ -0,0 +1,54 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class ChartJobs:
+    """Renders charts on a thread pool, so a callback can return at once and
+    the page poll for the finished chart.
+
+    A job submitted with ``replaces`` cancels that earlier job if it has not
+    started yet: a page whose year slider is dragged queues only its latest
+    chart, not one per step. A job that already started runs to the end
+    (its chart still lands in the render cache). Jobs are kept until
+    ``max_jobs`` newer ones exist, so a page can poll a finished job more
+    than once.
+    """
+
+    def __init__(self, workers=2, max_jobs=256):
+        self.max_jobs = max_jobs
+        self.submitted = 0
+        self.cancelled = 0
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='chart-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, render, replaces=None, job_id=None):
+        """Start ``render()`` in the pool; returns the job id."""
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            stale = [self._jobs.pop(replaces, None)]
+            self._jobs[job_id] = self._pool.submit(render)
+            self.submitted += 1
+            while len(self._jobs) > self.max_jobs:
+                stale.append(self._jobs.popitem(last=False)[1])
+            for future in stale:
+                if future is not None and future.cancel():
+                    self.cancelled += 1
+        return job_id
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def result(self, job_id, timeout=0):
+        """``(True, chart)`` once job ``job_id`` has finished, after waiting up
+        to ``timeout`` seconds for it, else ``(False, None)``. Raises what the
+        render raised, and KeyError for a job this process does not know."""
+        with self._lock:
+            future = self._jobs[job_id]
+        try:
+            return True, future.result(timeout=timeout)
+        except TimeoutError:
+            return False, None
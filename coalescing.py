@@ -0,0 +1,62 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+
+class RequestCoalescer:
+    """Tells a callback when a newer request from the same page has made
+    the one it is answering redundant, so it can stop before rendering.
+
+    A request is redundant once every input it changed was changed again by
+    a later request of its page (``session``): those later requests
+    recompute everything this one would and the renderer drops its answer
+    anyway. A page that fires a request per step of its year slider has all
+    but the last step dropped at its next check, while a newer request that
+    changed something else does not drop it. The latest request per input
+    is kept for the ``max_sessions`` most recently active pages.
+    """
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self.requests = 0
+        self.superseded = 0
+        self.skipped = 0
+        self._sessions = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, session, inputs):
+        """Record a request of page ``session`` that changed ``inputs``;
+        returns the ticket to check it with. A request without a session
+        is never dropped."""
+        with self._lock:
+            self.requests += 1
+            if session is None:
+                return None
+            number = next(self._sequence)
+            latest = self._sessions.pop(session, {})
+            latest.update(dict.fromkeys(inputs, number))
+            self._sessions[session] = latest
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session, number, frozenset(inputs)
+
+    def is_superseded(self, ticket, skipped=1):
+        """Whether a newer request has changed every input of ``ticket``'s
+        request. If so the request counts as dropped, with the ``skipped``
+        computations it had left."""
+        if ticket is None:
+            return False
+        session, number, inputs = ticket
+        with self._lock:
+            latest = self._sessions.get(session, {})
+            if not all(latest.get(input, 0) > number for input in inputs):
+                return False
+            self.superseded += 1
+            self.skipped += skipped
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'superseded': self.superseded,
+                    'skipped': self.skipped, 'sessions': len(self._sessions)}
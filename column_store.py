@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+
+from data_cache import CACHE_DIR
+
+STORE_DIR = os.path.join(CACHE_DIR, 'store')
+META_FILE = 'meta.json'
+# when each line last used each of its releases, one empty file per release
+RELEASES_DIR = '.releases'
+# prefix of pruned generations moved out of the way until they are deleted
+REMOVED_PREFIX = '.removed-'
+
+
+class ColumnStore:
+    """Generations of read-only arrays, one .npy file each, that every worker
+    memory-maps instead of holding its own copy.
+
+    A generation is named by its caller, written to a temporary directory
+    and renamed into place, so a reader sees all of it or none of it, and of
+    two workers publishing the same generation only the first rename
+    sticks.
+
+    Every generation belongs to a release, the digest of the sources it was
+    built from, and every release to a line (a jurisdiction's cache
+    directory) of successive releases. Once a line uses a new release, the
+    generations of all but its ``keep`` most recently used releases are
+    removed, however many partitions each has: by default the current
+    release and the previous one, which workers not reloaded yet still
+    read. A generation is renamed away before it is deleted, so a reader
+    sees it whole or not at all here too. On Linux a worker that still maps
+    a removed generation keeps reading it until it attaches to a newer one.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, keep=2):
+        self.store_dir = store_dir
+        self.keep = keep
+
+    def path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def exists(self, name):
+        return os.path.isfile(os.path.join(self.path(name), META_FILE))
+
+    def publish(self, name, meta, arrays, release):
+        """Write ``arrays`` ({key: ndarray}) and the JSON-able ``meta`` as
+        generation ``name`` of ``release``, unless it is already there."""
+        if self.exists(name):
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.store_dir, prefix=f'.{name}-')
+        try:
+            for key, array in arrays.items():
+                np.save(os.path.join(tmp, key + '.npy'), np.ascontiguousarray(array))
+            with open(os.path.join(tmp, META_FILE), 'w') as f:
+                json.dump({'meta': meta, 'arrays': sorted(arrays), 'release': release}, f)
+            os.rename(tmp, self.path(name))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            # another worker published the same generation first
+            if not self.exists(name):
+                raise
+
+    def attach(self, name):
+        """``(meta, arrays)`` of generation ``name``, the arrays memory-mapped
+        read-only."""
+        folder = self.path(name)
+        with open(os.path.join(folder, META_FILE)) as f:
+            stored = json.load(f)
+        arrays = {key: np.load(os.path.join(folder, key + '.npy'), mmap_mode='r')
+                  for key in stored['arrays']}
+        return stored['meta'], arrays
+
+    def load(self, name, build, release):
+        """``(meta, arrays)`` of generation ``name`` of ``release``, published
+        first from the ``(meta, arrays)`` that ``build()`` returns if the
+        store does not have it."""
+        try:
+            if not self.exists(name):
+                self.publish(name, *build(), release)
+            return self.attach(name)
+        except FileNotFoundError:
+            # removed by another worker between the check and the attach,
+            # its release superseded twice since this worker loaded it
+            self.publish(name, *build(), release)
+            return self.attach(name)
+
+    def use_release(self, line, release):
+        """Record that ``line`` uses ``release`` from now on, and remove the
+        generations of releases no line keeps any more."""
+        folder = os.path.join(self.store_dir, RELEASES_DIR,
+                              hashlib.sha256(line.encode()).hexdigest()[:16])
+        os.makedirs(folder, exist_ok=True)
+        marker = os.path.join(folder, release)
+        new = not os.path.exists(marker)
+        with open(marker, 'a'):
+            os.utime(marker)
+        if new:
+            self.prune()
+
+    def generations(self):
+        """Names of the published generations."""
+        if not os.path.isdir(self.store_dir):
+            return []
+        return [name for name in os.listdir(self.store_dir)
+                if not name.startswith('.') and self.exists(name)]
+
+    def releases(self):
+        """The releases some line keeps, forgetting the others."""
+        kept = set()
+        root = os.path.join(self.store_dir, RELEASES_DIR)
+        lines = os.listdir(root) if os.path.isdir(root) else []
+        for line in lines:
+            used = []
+            for release in os.listdir(os.path.join(root, line)):
+                try:
+                    used.append((os.stat(os.path.join(root, line, release)).st_mtime_ns,
+                                 release))
+                except FileNotFoundError:
+                    pass
+            used.sort(reverse=True)
+            kept.update(release for _, release in used[:self.keep])
+            for _, release in used[self.keep:]:
+                try:
+                    os.remove(os.path.join(root, line, release))
+                except FileNotFoundError:
+                    pass
+        return kept
+
+    def remove(self, name):
+        """Remove generation ``name``, unless another worker already did."""
+        removed = os.path.join(self.store_dir, f'{REMOVED_PREFIX}{name}-{uuid.uuid4().hex}')
+        try:
+            os.rename(self.path(name), removed)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(removed, ignore_errors=True)
+
+    def prune(self):
+        kept = self.releases()
+        for name in self.generations():
+            try:
+                with open(os.path.join(self.path(name), META_FILE)) as f:
+                    release = json.load(f).get('release')
+            except (OSError, ValueError):
+                continue
+            # generations from before releases were recorded have none
+            if release not in kept:
+                self.remove(name)
+        # left by a worker that stopped while deleting one
+        for name in os.listdir(self.store_dir):
+            if name.startswith(REMOVED_PREFIX):
+                shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
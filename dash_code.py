@@ -1,116 +1,380 @@
-from io import BytesIO
+import copy
+import logging
+import os
+import threading
+from collections import namedtuple
 
 import pandas as pd
 import numpy as np
 
-import altair as alt
-
+# altair is imported by the chart builders, on first use: a worker serving a
+# prerendered bundle never needs it
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 
-import base64
-from PIL import Image
+from aggregates import AggregateCube
+from chart_bundle import ChartBundle
+from chart_jobs import ChartJobs
+from coalescing import RequestCoalescer
+from column_store import ColumnStore
+from data_api import DataApi
+from data_cache import (CACHE_DIR, DATA_DIR, METRICS, SourceWatcher, discover_sources,
+                        load_wait_times, row_flags)
+from forecasting import Forecasts, load_forecasts
+import http_cache
+from map_images import MapImages
+from metrics import metrics
+from partitions import Jurisdiction, PartitionCache, PartitionedDataset, discover_jurisdictions
+from render_cache import RenderCache, cached_render
+from sql_backend import load_sqlite
+
+
+# "html" renders every chart as a standalone page for an Iframe, "spec" sends
+# only the Vega-Lite spec to one vega-embed renderer kept in the page
+CHART_RENDERING = os.environ.get('CHART_RENDERING', 'html')
+VEGA_SCRIPTS = ['https://cdn.jsdelivr.net/npm/vega@5',
+                'https://cdn.jsdelivr.net/npm/vega-lite@4.17.0',
+                'https://cdn.jsdelivr.net/npm/vega-embed@6']
+
+# CHART_BUNDLE=<dir> serves the charts prerendered there by prerender.py
+# instead of querying the data
+CHART_BUNDLE = os.environ.get('CHART_BUNDLE')
+
+# where the queries run: "cubes" of running totals memory-mapped from the
+# column store, or "sqlite", indexed SQL on a database that stays on disk
+DATA_BACKEND = os.environ.get('DATA_BACKEND', 'cubes')
+
+# the cube backend loads a jurisdiction's data a fiscal year at a time, when
+# a query first touches the year; at most MAX_PARTITIONS years (of all
+# jurisdictions together) stay loaded, least recently used ones are dropped
+MAX_PARTITIONS = int(os.environ.get('MAX_PARTITIONS', 32))
+
+# the workbooks in data/; other jurisdictions are the subdirectories of
+# data/jurisdictions/, picked in the selector above the authority buttons
+DEFAULT_JURISDICTION = "British Columbia"
+# title of the page per jurisdiction, the upper-cased name for the others
+JURISDICTION_TITLES = {DEFAULT_JURISDICTION: "BC"}
+
+# health authority buttons and year slider range
+AUTHORITIES = ["Interior", "Fraser", "Vancouver Coastal", "Vancouver Island",
+               "Northern", "Provincial"]
+YEARS = (2009, 2022)
+# what the page shows when it loads
+DEFAULT_AUTHORITY = "Interior"
+DEFAULT_YEARS = [2017, 2022]
+# the slider's range is sent to the server once it has been still this long,
+# so stepping across several years with clicks or arrow keys sends one update
+YEAR_DEBOUNCE_MS = 300
+
+# CHART_JOBS=<threads> renders the hospital wait/complete chart, the slowest
+# one (a column per quarter), on a thread pool: the callback returns at once
+# and the page polls every JOB_POLL_MS until the chart is ready
+CHART_JOBS = int(os.environ.get('CHART_JOBS', 0))
+JOB_POLL_MS = 250
+# a chart finished within this many seconds is shown without a placeholder
+JOB_FIRST_WAIT = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+@metrics.phase('render')
+def render_chart(chart):
+    if CHART_RENDERING == 'spec':
+        return chart.to_json(indent=None)
+    return chart.to_html()
+
+
+# query results, returned instead of stored on SurgicalPlots so one instance
+# can serve concurrent callbacks
+ProcedureRanking = namedtuple('ProcedureRanking', ['fastest', 'slowest'])
+HospitalCases = namedtuple('HospitalCases', ['hosp_list', 'one_hospital'])
+AuthorityRows = namedtuple('AuthorityRows', ['count', 'no_cataract'])
+
+
+# one generation of the prepared data. load_data swaps it in as a whole, and
+# a callback reads it from SurgicalPlots.snapshot(), so one that runs across
+# a reload reads only one generation. generation
+# names it in the column store, None for data prepared in the process;
+# forecasts are its Forecasts (forecasting.py), None for none
+class Dataset(namedtuple('Dataset', [
+        'qdata', 'count', 'authority_rows', 'authority_cube', 'count_cube',
+        'procedure_cube', 'hospital_series', 'hospital_index', 'generation',
+        'forecasts'])):
+    # the queries SurgicalPlots runs, answered from the cubes; SqliteDataset
+    # (sql_backend.py) answers the same ones in SQL
+    __slots__ = ()
+
+    # health authorities with hospitals, and the fiscal years of the data
+    def authorities(self):
+        return list(self.hospital_index)
+
+    def years(self):
+        return self.authority_cube.years.tolist()
+
+    # sorted hospitals of a health authority
+    def hospitals(self, health_authority):
+        return self.hospital_index.get(health_authority, [])
+
+    # waiting and completed sums of one hospital by quarter
+    def hospital_cells(self, health_authority, hospital, year):
+        series = self.hospital_series.get(health_authority)
+        if series is None:
+            return pd.DataFrame(
+                columns=['hospital', 'year', 'quarter', 'waiting', 'completed'])
+        return series.cells(hospital, year)
+
+    # waiting and completed sums of an authority's hospitals by quarter
+    def authority_cells(self, health_authority, year):
+        return self.count_cube.cells(health_authority, year)
+
+    # total waiting and completed cases and mean wait times, over every row
+    # of the authority including its "All" totals, as the score cards show
+    def totals(self, health_authority, year):
+        cube = self.authority_cube
+        return (cube.total(health_authority, year, 'waiting'),
+                cube.total(health_authority, year, 'completed'),
+                cube.mean(health_authority, year, 'wait_time_50'),
+                cube.mean(health_authority, year, 'wait_time_90'))
+
+    # the k procedures with the lowest and highest mean `metric`
+    def ranked_procedures(self, health_authority, year, metric, k):
+        return self.procedure_cube.ranked(health_authority, year, metric, k)
+
+
+# bump when prepare_data changes what it stores
+DATASET_VERSION = 1
+
+
+# the buttons say "Provincial", the data says "Provincial Health Services Authority"
+def authority_name(health_authority):
+    if health_authority == "Provincial":
+        return "Provincial Health Services Authority"
+    return health_authority
+
+
+def prepare_data(qdata):
+    """Metadata and arrays of the prepared dataset of the cleaned table
+    ``qdata``, as open_data reads them back and the column store keeps them."""
+    # drop "All" data, and for the analysis rows with NAs and Cataract Surgery
+    detail, analysed = row_flags(qdata)
+
+    # order the rows so every table the queries use is a slice (a view,
+    # not a copy) of qdata: detail rows grouped by health authority with
+    # each authority's analysed rows first, then the "All" rows
+    authority_codes = pd.factorize(qdata['health_authority'], sort=True)[0]
+    order = np.lexsort((~analysed.to_numpy(), authority_codes, ~detail.to_numpy()))
+    qdata = qdata.take(order).reset_index(drop=True)
+    analysed = analysed.to_numpy()[order]
+    count = qdata.iloc[:int(detail.sum())]
+
+    meta = {'columns': list(qdata.columns), 'categories': {},
+            'detail_rows': len(count), 'authorities': [], 'cubes': {}}
+    arrays = {}
+    for column in qdata.columns:
+        values = qdata[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            meta['categories'][column] = values.cat.categories.tolist()
+            values = values.cat.codes
+        arrays[f'column.{column}'] = values.to_numpy()
+
+    def add_cube(name, cube):
+        meta['cubes'][name], cube_arrays = cube.state()
+        arrays.update({f'{name}.{key}': array for key, array in cube_arrays.items()})
+
+    # each authority's rows and analysed rows, and per hospital of the
+    # authority its waiting and completed sums by year and quarter
+    if len(count):
+        codes = authority_codes[order][:len(count)]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(count)]):
+            rows = count.iloc[start:end]
+            position = len(meta['authorities'])
+            meta['authorities'].append([rows['health_authority'].iat[0], int(start),
+                                        int(end), int(analysed[start:end].sum())])
+            add_cube(f'hospital{position}', AggregateCube(
+                rows, ['waiting', 'completed'], keys=('hospital',)))
+
+    # per authority, year and quarter aggregates, answered by prefix sums
+    add_cube('authority', AggregateCube(qdata, METRICS))
+    add_cube('count', AggregateCube(count, ['waiting', 'completed']))
+    # per authority and procedure, for ranking procedures by wait time
+    add_cube('procedure', AggregateCube(
+        qdata[analysed], METRICS,
+        keys=('health_authority', 'procedure'), cell_means=True))
+    return meta, arrays
+
+
+def open_data(meta, arrays, generation=None, forecasts=None):
+    """The Dataset over ``arrays`` from prepare_data, without copying them:
+    tables are views of the arrays, which may be read-only memory maps."""
+    columns = {}
+    for column in meta['columns']:
+        values = arrays[f'column.{column}']
+        if column in meta['categories']:
+            values = pd.Categorical.from_codes(
+                values, categories=meta['categories'][column])
+        columns[column] = values
+    qdata = pd.DataFrame(columns, columns=meta['columns'], copy=False)
+    count = qdata.iloc[:meta['detail_rows']]
+
+    def cube(name):
+        prefix = name + '.'
+        return AggregateCube.from_state(meta['cubes'][name], {
+            key[len(prefix):]: array for key, array in arrays.items()
+            if key.startswith(prefix)})
+
+    authority_rows = {}
+    hospital_series = {}
+    for position, (authority, start, end, analysed_rows) in enumerate(meta['authorities']):
+        rows = count.iloc[start:end]
+        authority_rows[authority] = AuthorityRows(rows, rows.iloc[:analysed_rows])
+        hospital_series[authority] = cube(f'hospital{position}')
+
+    return Dataset(
+        qdata=qdata, count=count, authority_rows=authority_rows,
+        authority_cube=cube('authority'), count_cube=cube('count'),
+        procedure_cube=cube('procedure'), hospital_series=hospital_series,
+        # sorted hospitals of each authority, for the dropdown
+        hospital_index={authority: list(series.labels[0])
+                        for authority, series in hospital_series.items()},
+        generation=generation, forecasts=forecasts)
+
+
+# the prepared dataset of fiscal ``year`` of the versions of a jurisdiction's
+# workbooks ``manifests`` pins, a partition of its PartitionedDataset,
+# published to the column store by the first process to need it and
+# memory-mapped by the others
+def load_partition(store, jurisdiction, manifests, digest, year):
+    generation = f'wait-times-v{DATASET_VERSION}-{digest}-{year}'
+    return open_data(*store.load(generation, lambda: prepare_data(load_wait_times(
+        cache_dir=jurisdiction.cache_dir, year=year, manifests=manifests)),
+        digest), generation)
 
 
 class SurgicalPlots:
-    def __init__(self):
-
-        # read in data
-        path = 'data/2009_2021-quarterly-surgical_wait_times.xlsx'
-        qdata = pd.read_excel(path)
-        newdata = pd.read_excel(
-            'data/2021_2022-quarterly-surgical_wait_times-q3-interim.xlsx')
-        qdata = pd.concat([qdata, newdata])
-        qdata.columns = qdata.columns.str.lower()
-
-        # Rename columns
-        qdata.rename(columns={'fiscal_year': 'year',
-                              'hospital_name': 'hospital',
-                              'procedure_group': 'procedure',
-                              'completed_50th_percentile': 'wait_time_50',
-                              'completed_90th_percentile': 'wait_time_90'}, inplace=True)
-
-        # Format year column
-        qdata['year'] = qdata['year'].str.replace('(/).*', "")
-        qdata['year'] = pd.to_numeric(qdata['year'])
-
-        # convert <5 string to median value of 3
-        qdata = qdata.replace('<5', 3)
-        self.qdata = qdata
-        # drop rows with NAs
-        clean = qdata.dropna()
-        count = qdata.iloc[:, 0:7]
-
-        # drop "All" data
-        main = clean.query(
-            'procedure != "All Procedures" & hospital != "All Facilities" & health_authority != "All Health Authorities"')
-        count = count.query(
-            'procedure != "All Procedures" & hospital != "All Facilities" & health_authority != "All Health Authorities"')
-        self.count = count
-        all = clean.query(
-            'procedure == "All Procedures" & hospital == "All Facilities" & health_authority == "All Health Authorities"')
-
-        authority = count.groupby(
-            ['health_authority', 'year', 'quarter']).sum().reset_index()
-
-        # authority data with calculated complete case ratio
-        authority_comp_prop = authority.copy()
-        authority_comp_prop['ratio'] = authority_comp_prop['completed'] / \
-            (authority_comp_prop['completed']+authority_comp_prop['waiting'])
-        self.authority_comp_prop = authority_comp_prop
-
-        # Cataract Surgery is a unique high volume procedure often performed in seperate OR facilities and will be excluded from a part of the analysis.
-        self.no_cataract = main.query('procedure != "Cataract Surgery"')
-
-    def filtering(self, health_authority, year):
+    # data is a cleaned table like load_wait_times() returns, prepared in
+    # this process; without it the jurisdiction's workbooks (by default
+    # those in data/) are partitioned by fiscal year in the column store,
+    # or with the "sqlite" backend written to their database. partitions is
+    # the PartitionCache of loaded years, which jurisdictions can share
+    def __init__(self, data=None, store=None, backend=None, jurisdiction=None,
+                 partitions=None):
+        self.backend = DATA_BACKEND if backend is None else backend
+        if self.backend not in ('cubes', 'sqlite'):
+            raise ValueError(f'unknown data backend {self.backend!r}')
+        self.jurisdiction = jurisdiction or Jurisdiction(
+            DEFAULT_JURISDICTION, DATA_DIR, CACHE_DIR)
+        # rendered charts, keyed by chart kind and callback inputs
+        self.charts = RenderCache()
+        self.store = ColumnStore() if store is None else store
+        self.partitions = PartitionCache(MAX_PARTITIONS) if partitions is None else partitions
+        self.load_data(data)
+
+    # forecasts are fitted with the data: in this process for a table, else
+    # published to the column store next to the prepared data
+    def load_data(self, data=None):
+        jurisdiction = self.jurisdiction
+        if data is not None:
+            self.data = open_data(*prepare_data(data), forecasts=Forecasts.build([data]))
+        elif self.backend == 'sqlite':
+            paths = discover_sources(jurisdiction.data_dir)
+            self.data = load_sqlite(
+                paths, os.path.join(jurisdiction.cache_dir, 'sqlite'),
+                forecasts=load_forecasts(self.store, paths, jurisdiction.cache_dir),
+                cache_dir=jurisdiction.cache_dir)
+        else:
+            self.data = PartitionedDataset(
+                jurisdiction, self.store, self.partitions, load_partition)
+
+    # sorted hospitals of a health authority, for the dropdown
+    def hospitals(self, health_authority):
+        return self.data.hospitals(health_authority)
+
+    # the k fastest and k slowest procedures of an authority and date range,
+    # by the mean over its quarters of `metric`
+    @metrics.phase('query')
+    def filtering(self, health_authority, year, metric='wait_time_90', k=5):
         # rename health authority
-        if(health_authority == "Provincial"):
-            health_authority = "Provincial Health Services Authority"
-
-        # filter health authority
-        no_cataract_authority = self.no_cataract[self.no_cataract['health_authority']
-                                                 == health_authority]
-
-        # grouping by procedure
-        procedure = no_cataract_authority.groupby(
-            ['procedure', 'year', 'quarter']).mean().reset_index()
-
-        # subsett from 2017 to current year
-        procedure = procedure[(procedure['year'] >= year[0])
-                              & (procedure['year'] <= year[1])]
-        procedure['time'] = procedure['year'].map(str)+procedure['quarter']
-        procedure_unite = procedure.drop(columns=['year', 'quarter'])
-
-        # most treated and less treated surgeries
-        procedure_order = procedure_unite.groupby(
-            'procedure').mean().reset_index()
-        procedure_order = procedure_order.sort_values('wait_time_90')
-
-        # fastest and slowest procedures
-        self.fastest = procedure_order.head(5)
-        self.slowest = procedure_order.tail(5)
-
-        # round off numbers to 2 decimal places
-        self.fastest = self.fastest.round(2)
-        self.slowest = self.slowest.round(2)
-
-    def fastest_procedures(self, health_authority, year):
-        self.filtering(health_authority, year)
-        sort_order = self.fastest['wait_time_90'].to_list()
-        procedure_time_chart = alt.Chart(self.fastest, width=400, height=270).mark_bar(size=20,
+        health_authority = authority_name(health_authority)
+
+        # both ends of the ranking in one query
+        fastest, slowest = self.data.ranked_procedures(
+            health_authority, year, metric, k)
+
+        # rounded off to 2 decimal places
+        return ProcedureRanking(fastest.round(2), slowest.round(2))
+
+    # re-read the workbooks (only rebuilding changed caches), swap in the new
+    # generation and drop stale charts
+    def reload(self):
+        self.load_data()
+        self.charts.clear()
+
+    # this SurgicalPlots with the current generation of the data, for every
+    # query and chart of one callback; charts rendered after a reload from
+    # the generation it replaced are not cached. The cache is pinned before
+    # the data is read, so a reload in between only leaves charts uncached
+    def snapshot(self):
+        charts = self.charts.pinned()
+        plots = copy.copy(self)
+        plots.charts = charts
+        return plots
+
+    # projections continue the latest quarters, so they are shown only with
+    # a year range that reaches them
+    def shows_forecast(self, year):
+        forecasts = self.data.forecasts
+        return forecasts is not None and year[1] >= forecasts.last[0]
+
+    # projected 90th percentile wait of the given procedures of an authority
+    @metrics.phase('query')
+    def projected_waits(self, health_authority, year, procedures):
+        if not self.shows_forecast(year):
+            return pd.DataFrame(columns=['procedure', 'wait_time_90'])
+        projected = self.data.forecasts.procedure_means(
+            authority_name(health_authority), 'wait_time_90')
+        return projected[projected['procedure'].isin(procedures)].round(2)
+
+    # a procedure chart with a tick at each procedure's projected wait
+    def with_projected_waits(self, chart, ranked, health_authority, year, sort_order):
+        import altair as alt
+
+        projected = self.projected_waits(health_authority, year, ranked['procedure'])
+        if not len(projected):
+            return chart
+        return chart + alt.Chart(projected).mark_tick(
+            color='black', thickness=2, size=20).encode(
+            x='wait_time_90',
+            y=alt.Y('procedure', sort=sort_order),
+            tooltip=[alt.Tooltip('wait_time_90', title='projected')])
+
+    def fastest_chart(self, health_authority, year):
+        import altair as alt
+
+        fastest = self.filtering(health_authority, year).fastest
+        sort_order = fastest['wait_time_90'].to_list()
+        procedure_time_chart = alt.Chart(fastest, width=400, height=270).mark_bar(size=20,
                                                                                        point={"filled": False, "fill": "white"}).encode(
             x=alt.X('wait_time_90', axis=alt.Axis(values=np.arange(0, 14, 2))),
             y=alt.Y('procedure', scale=alt.Scale(zero=False), sort=sort_order),
             color=alt.Color('procedure', legend=None))
         procedure_time_chart = procedure_time_chart + \
             procedure_time_chart.mark_text(dx=15).encode(text="wait_time_90")
-        return procedure_time_chart.to_html()
+        return self.with_projected_waits(
+            procedure_time_chart, fastest, health_authority, year, sort_order)
 
-    def slowest_procedures(self, health_authority, year):
-        self.filtering(health_authority, year)
-        sort_order = self.slowest['wait_time_90'].to_list()
-        procedure_time_chart = alt.Chart(self.slowest, width=400, height=270).mark_bar(size=20,
+    @cached_render('fastest')
+    def fastest_procedures(self, health_authority, year):
+        return render_chart(self.fastest_chart(health_authority, year))
+
+    def slowest_chart(self, health_authority, year):
+        import altair as alt
+
+        slowest = self.filtering(health_authority, year).slowest
+        sort_order = slowest['wait_time_90'].to_list()
+        procedure_time_chart = alt.Chart(slowest, width=400, height=270).mark_bar(size=20,
                                                                                        point={"filled": False, "fill": "white"}).encode(
             x=alt.X('wait_time_90', axis=alt.Axis(
                 values=np.arange(0, 150, 10))),
@@ -118,41 +382,45 @@ class SurgicalPlots:
             color=alt.Color('procedure', legend=None))
         procedure_time_chart = procedure_time_chart + \
             procedure_time_chart.mark_text(dx=15).encode(text="wait_time_90")
-        return procedure_time_chart.to_html()
-
-    # data grouped by hospital for selected health authority and date range
-    def data_by_hosp(self, health_authority, year, hospname):
-
-        # filter and arrange data for plotting
-        # print(self.count.health_authority.unique())
-
-        # print(self.count[self.count['health_authority']==health_authority].groupby(['hospital', 'year', 'quarter'])['waiting','completed'].sum().reset_index()
-        hosp_data = self.count[self.count['health_authority']
-                               == health_authority]
-        hosp_data = hosp_data.groupby(['hospital', 'year', 'quarter'])[
-            'waiting', 'completed'].sum().reset_index()
+        return self.with_projected_waits(
+            procedure_time_chart, slowest, health_authority, year, sort_order)
 
-        hosp_data = hosp_data[(hosp_data['year'] >= year[0])
-                              & (hosp_data['year'] <= year[1])]
-
-        hosp_data_melted = hosp_data.melt(
-            id_vars=['hospital', 'year', 'quarter'])
-
-        hosp_data_melted['time'] = hosp_data_melted['year'].map(
-            str)+hosp_data_melted['quarter']
-
-        hosp_data_melted = hosp_data_melted.drop(columns=['year', 'quarter'])
-
-        # create hospital dropdown list
-        self.hosp_list = hosp_data_melted.hospital.unique()
-
-        # waiting and completed cases for chosen hospital
-        self.one_hospital = hosp_data_melted[hosp_data_melted['hospital'] == hospname]
-
-    def wait_complete_plot(self, health_authority, year, hospname):
+    @cached_render('slowest')
+    def slowest_procedures(self, health_authority, year):
+        return render_chart(self.slowest_chart(health_authority, year))
 
-        self.data_by_hosp(health_authority, year, hospname)
-        wc_plot = alt.Chart(self.one_hospital).mark_bar(size=15).encode(
+    # waiting and completed cases of one hospital for a date range
+    @metrics.phase('query')
+    def data_by_hosp(self, health_authority, year, hospname):
+        data = self.data
+        # hospital dropdown list
+        hosp_list = data.hospitals(health_authority)
+
+        # sums by quarter for the chosen hospital
+        hosp_data = data.hospital_cells(health_authority, hospname, year)
+
+        # arrange data for plotting
+        one_hospital = hosp_data.melt(id_vars=['hospital', 'year', 'quarter'])
+        one_hospital['time'] = one_hospital['year'].map(
+            str)+one_hospital['quarter'].astype(str)
+        one_hospital = one_hospital.drop(columns=['year', 'quarter'])
+        return HospitalCases(hosp_list, one_hospital)
+
+    # waiting and completed sums by quarter of each hospital of an authority,
+    # or of the given ones, a table per hospital as the caller reads them
+    def hospital_cases(self, health_authority, year, hospitals=None):
+        data = self.data
+        if hospitals is None:
+            hospitals = data.hospitals(health_authority)
+        for hospital in hospitals:
+            yield data.hospital_cells(health_authority, hospital, year)
+
+    def wait_complete_chart(self, health_authority, year, hospname):
+        import altair as alt
+
+        one_hospital = self.data_by_hosp(
+            health_authority, year, hospname).one_hospital
+        wc_plot = alt.Chart(one_hospital).mark_bar(size=15).encode(
             x=alt.X('variable', axis=alt.Axis(
                 title=None, labels=False, ticks=False)),
             y=alt.Y('value', scale=alt.Scale(zero=False),
@@ -164,58 +432,127 @@ class SurgicalPlots:
                          ).properties(height=270
                                       ).configure_facet(spacing=7
                                                         )
-        return wc_plot.to_html()
+        return wc_plot
+
+    @cached_render('wait_complete')
+    def wait_complete_plot(self, health_authority, year, hospname):
+        return render_chart(self.wait_complete_chart(health_authority, year, hospname))
 
     # data grouped by health authority for a date range
+    @metrics.phase('query')
     def data_compprop(self, year, health_authority):
-        # data subseted by health authority
-        compprop_authority = self.authority_comp_prop[
-            self.authority_comp_prop['health_authority'] == health_authority]
+        # waiting and completed sums by quarter for the authority and date range
+        compprop = self.data.authority_cells(health_authority, year)
 
-        # data selected for a date range
-        compprop_authority_year = compprop_authority[(
-            compprop_authority['year'] >= year[0]) & (compprop_authority['year'] <= year[1])]
-        self.compprop = compprop_authority_year
+        # authority data with calculated complete case ratio
+        compprop['ratio'] = compprop['completed'] / \
+            (compprop['completed']+compprop['waiting'])
+        return compprop
+
+    # totals and mean wait times for the score cards
+    @metrics.phase('query')
+    def score_cards(self, health_authority, year):
+        total_waiting, total_completed, mean_wait_time_50, mean_wait_time_90 = \
+            self.data.totals(health_authority, year)
+        # no wait times in the range (a year past the data) leaves the card empty
+        means = [None if np.isnan(mean) else round(mean)
+                 for mean in (mean_wait_time_50, mean_wait_time_90)]
+        return int(total_waiting), int(total_completed), *means
+
+    # projected completion ratio of the next quarters, each joined to the
+    # latest ratio of its quarter in compprop; empty unless shown
+    @metrics.phase('query')
+    def projected_ratio(self, year, health_authority, compprop):
+        if not self.shows_forecast(year):
+            return pd.DataFrame(columns=['year', 'quarter', 'ratio', 'projected'])
+        projected = self.data.forecasts.authority_ratio(health_authority)
+        latest = compprop.dropna(subset=['ratio']).drop_duplicates('quarter', keep='last')
+        return pd.concat([latest[['year', 'quarter', 'ratio']].assign(projected=False),
+                          projected[['year', 'quarter', 'ratio']].assign(projected=True)],
+                         ignore_index=True)
 
     # complete proportion plot
-    def comp_prop_plot(self, year, health_authority):
-        self.data_compprop(year, health_authority)
-#        print(self.compprop)
-        compprop_plot = alt.Chart(self.compprop, width=405, height = 300).mark_line().encode(
+    def comp_prop_chart(self, year, health_authority):
+        import altair as alt
+
+        compprop = self.data_compprop(year, health_authority)
+        compprop_plot = alt.Chart(compprop, width=405, height = 300).mark_line().encode(
             x=alt.X('year:N'),
             y=alt.Y('ratio:Q', scale=alt.Scale(zero=False)),
             color=alt.Color('quarter'))
         compprop_plot = compprop_plot+compprop_plot.mark_circle()
-        return compprop_plot.to_html()
 
+        # dashed on to the projected ratios, drawn as open points
+        projected = self.projected_ratio(year, health_authority, compprop)
+        if len(projected):
+            forecast = alt.Chart(projected).mark_line(strokeDash=[4, 4]).encode(
+                x=alt.X('year:N'), y=alt.Y('ratio:Q'), color=alt.Color('quarter'))
+            compprop_plot = compprop_plot + forecast + forecast.mark_point().transform_filter(
+                alt.datum.projected)
+        return compprop_plot
 
-surgical_plots = SurgicalPlots()
+    @cached_render('comp_prop')
+    def comp_prop_plot(self, year, health_authority):
+        return render_chart(self.comp_prop_chart(year, health_authority))
 
 
-def map_image_plot(authority):
-    print(authority)
-    if authority == "Interior":
-        print("Image found")
-        img = Image.open('data/images/interior.png')
-    elif authority == "Fraser":
-        img = Image.open('data/images/fraser.png')
-    elif authority == "Vancouver Coastal":
-        img = Image.open('data/images/vancoastal.png')
-    elif authority == "Vancouver Island":
-        img = Image.open('data/images/vanisland.png')
-    elif authority == "Northern":
-        img = Image.open('data/images/northern.png')
-    elif authority == "Provincial":
-        img = Image.open('data/images/provincial.png')
-
-    def image_formatter2(im):
-        with BytesIO() as buffer:
-            im.save(buffer, 'png')
-            data = base64.encodebytes(buffer.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{data}"
+if CHART_BUNDLE:
+    surgical_plots = ChartBundle(CHART_BUNDLE, rendering=CHART_RENDERING)
+    # a bundle has the default jurisdiction's charts only
+    jurisdictions = {DEFAULT_JURISDICTION: None}
+else:
+    jurisdictions = discover_jurisdictions(DEFAULT_JURISDICTION)
+    # one store, and one bound on the loaded partitions, for all jurisdictions
+    column_store = ColumnStore()
+    partition_cache = PartitionCache(MAX_PARTITIONS)
+    surgical_plots = SurgicalPlots(store=column_store, partitions=partition_cache)
+jurisdiction_plots = {DEFAULT_JURISDICTION: surgical_plots}
+jurisdiction_lock = threading.Lock()
+
+
+# the SurgicalPlots of a jurisdiction, created the first time it is selected
+def plots_for(jurisdiction):
+    with jurisdiction_lock:
+        plots = jurisdiction_plots.get(jurisdiction)
+        if plots is None:
+            plots = jurisdiction_plots[jurisdiction] = SurgicalPlots(
+                jurisdiction=jurisdictions[jurisdiction], store=column_store,
+                partitions=partition_cache)
+            metrics.add_cache(f'charts {jurisdiction}', plots.charts)
+    return plots
+
+
+# a jurisdiction not selected yet reads the new workbooks when it is
+def reload_jurisdiction(jurisdiction):
+    plots = jurisdiction_plots.get(jurisdiction)
+    if plots is not None:
+        plots.reload()
+
+# pick up new quarterly releases in data/ without restarting workers,
+# DATA_WATCH_INTERVAL=0 turns this off
+DATA_WATCH_INTERVAL = float(os.environ.get('DATA_WATCH_INTERVAL', 60))
+
+
+# started with the first request rather than at import: threads do not
+# survive the fork of a gunicorn preload_app master, so each worker runs its
+# own, one per jurisdiction
+def start_watcher():
+    if DATA_WATCH_INTERVAL > 0 and not CHART_BUNDLE:
+        for name, jurisdiction in jurisdictions.items():
+            SourceWatcher(lambda name=name: reload_jurisdiction(name),
+                          data_dir=jurisdiction.data_dir,
+                          interval=DATA_WATCH_INTERVAL).start()
+
+
+# health authority maps, encoded on first use and served from /maps/
+map_images = MapImages()
+
+
+def map_image_chart(authority):
+    import altair as alt
 
     source = pd.DataFrame([
-        {"x": 0, "y": 0, "img": image_formatter2(img)}
+        {"x": 0, "y": 0, "img": map_images.url(authority)}
     ])
 
     plot_img = alt.Chart(source).mark_image(
@@ -230,7 +567,65 @@ def map_image_plot(authority):
     ).configure_view(
         strokeWidth=0
     )
-    return plot_img.to_html()
+    return plot_img
+
+
+map_charts = RenderCache(max_entries=16)
+
+
+@cached_render('map', cache=map_charts)
+def map_image_plot(authority):
+    return render_chart(map_image_chart(authority))
+
+
+if CHART_BUNDLE:
+    map_image_plot = surgical_plots.map_image_plot
+
+
+# short text in place of a chart, e.g. while it is rendered in the background
+def message_chart(text):
+    import altair as alt
+
+    return alt.Chart(pd.DataFrame({'text': [text]}), width=400, height=270).mark_text(
+        size=16, color='gray').encode(text='text').configure_view(strokeWidth=0)
+
+
+message_charts = RenderCache(max_entries=8)
+
+
+@cached_render('message', cache=message_charts)
+def message_plot(text):
+    return render_chart(message_chart(text))
+
+
+chart_jobs = ChartJobs(CHART_JOBS) if CHART_JOBS else None
+
+
+# render the charts of the page-load view into the caches; called in the
+# gunicorn master (see gunicorn.conf.py) so every forked worker starts with them
+def warm_up():
+    health_authority = authority_name(DEFAULT_AUTHORITY)
+    surgical_plots.comp_prop_plot(DEFAULT_YEARS, health_authority)
+    map_image_plot(DEFAULT_AUTHORITY)
+    surgical_plots.fastest_procedures(health_authority, DEFAULT_YEARS)
+    surgical_plots.wait_complete_plot(
+        health_authority, DEFAULT_YEARS, surgical_plots.hospitals(health_authority)[0])
+
+
+# chart container, an Iframe for html rendering or a div drawn by
+# assets/vega_charts.js from the spec in a dcc.Store for spec rendering
+def chart_frame(id, content, style):
+    if CHART_RENDERING == 'spec':
+        style = {k: v for k, v in style.items() if k != 'border-width'}
+        return html.Div([dcc.Store(id=id + '_spec', data=content),
+                         html.Div(id=id, style=style)])
+    return html.Iframe(id=id, srcDoc=content, style=style)
+
+
+def chart_output(id):
+    if CHART_RENDERING == 'spec':
+        return Output(id + '_spec', 'data')
+    return Output(id, 'srcDoc')
 
 
 # All the score cards
@@ -286,33 +681,49 @@ wait_90_card = dbc.Card(
            'align-items': 'center', 'justify-content': 'center', "border": "10px lightgray solid"}
 )
 
+def page_title(jurisdiction):
+    return 'SURGICAL WAIT TIMES - ' + JURISDICTION_TITLES.get(jurisdiction, jurisdiction).upper()
+
+
+def year_marks(years):
+    return {i: f'{i}' for i in range(years[0], years[1] + 1)}
+
+
 # year slider
 yr_slider=html.Div([
         dcc.RangeSlider(
-            id="year_slider",min=2009, max=2022,
-            step=1, marks={i: f'{i}' for i in range(2009, 2023)},
-            value=[2017, 2022],
+            id="year_slider",min=YEARS[0], max=YEARS[1],
+            step=1, marks=year_marks(YEARS),
+            value=DEFAULT_YEARS,
             vertical=True,
             verticalHeight=900
-            )        
+            ),
+        # the slider's range once it has been still for YEAR_DEBOUNCE_MS,
+        # what the dashboard updates from
+        dcc.Store(id='year_range', data=DEFAULT_YEARS),
+        dcc.Interval(id='year_debounce', interval=YEAR_DEBOUNCE_MS, disabled=True)
         ],style={"border": "10px lightgray solid"})
 
 # health authority radio buttons
 ha_buttons = html.Div([
     dcc.RadioItems(
         id="health_authority_buttons",
-        options=[
-            {"label": "Interior", "value": "Interior"},
-            {"label": "Fraser", "value": "Fraser"},
-            {"label": "Vancouver Coastal", "value": "Vancouver Coastal"},
-            {"label": "Vancouver Island", "value": "Vancouver Island"},
-            {"label": "Northern", "value": "Northern"},
-            {"label": "Provincial", "value": "Provincial"},
-        ],
-        value='Interior',
+        options=[{"label": authority, "value": authority}
+                 for authority in AUTHORITIES],
+        value=DEFAULT_AUTHORITY,
         labelStyle = {'cursor': 'pointer', 'margin-left':'25px'})],
         style = {'stroke-width': '20px'})
 
+# jurisdiction selector, hidden unless data/jurisdictions/ adds one
+jurisdiction_dropdown = html.Div([
+    dcc.Dropdown(
+        id='jurisdiction_dropdown',
+        options=[{'label': name, 'value': name} for name in jurisdictions],
+        value=DEFAULT_JURISDICTION,
+        clearable=False)],
+    style={'width': '300px', 'margin': '0 auto 10px auto', 'font-size': '16px',
+           'display': 'block' if len(jurisdictions) > 1 else 'none'})
+
 # hospital dropdown
 hosp_dropdown=html.Div([
             dcc.Dropdown(
@@ -336,51 +747,78 @@ fast_slow_button = html.Div([
 ])
 
 
+# the charts start empty, the page-load callback fills them in
+
 # 1st plot - proportion of completed cases
 proportion_cases = html.Div([
-    html.Iframe(
+    chart_frame(
         id="comp_prop_plot_id",
-        srcDoc=surgical_plots.comp_prop_plot(
-            health_authority="Interior", year=[2017, 2022]),
+        content=None,
         style={'border-width': '0', 'width': '100%', 'height': '400px'}
     )
 ])
 
 # 2nd plot - BC map
-plot_map_object = html.Div([html.Iframe(
+plot_map_object = html.Div([chart_frame(
     id='map',
-    srcDoc=map_image_plot(authority='Interior'),
+    content=None,
     style={'border-width': '0', 'width': '100%', 'height': '500px'})
 ])
 
 # 3rd plot - procedure plot
 procedure_plot = html.Div([
-    html.Iframe(
+    chart_frame(
         id="procedure_plot_id",
-        srcDoc=surgical_plots.fastest_procedures(
-            health_authority="Interior", year=[2017, 2022]),
+        content=None,
         style={'border-width': '0', 'width': '100%', 'height': '400px'}
     )
 ])
 
 # 4th plot - hospital wait and completed cases
 hosp_wait_comp_cases = html.Div([
-    html.Iframe(
+    chart_frame(
         id="hosp_wait_comp_plot",
-        srcDoc=surgical_plots.wait_complete_plot(
-            health_authority="Interior", hospname="100 Mile District General Hospital", year=[2017, 2022]),
+        content=None,
         style={'border-width': '0', 'width': '500px',
                'height': '350px', 'display': 'inline-block'}
     )
 ])
-
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# with CHART_JOBS, the job rendering the chart and the timer polling for it
+if chart_jobs:
+    hosp_wait_comp_cases.children += [
+        dcc.Store(id='wait_complete_job'),
+        dcc.Interval(id='wait_complete_poll', interval=JOB_POLL_MS, disabled=True)]
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
+                external_scripts=VEGA_SCRIPTS if CHART_RENDERING == 'spec' else [])
 server = app.server
+server.before_first_request(start_watcher)
+map_images.register(server)
+# brotli/gzip responses, and content-hash ETags answered with 304s
+http_cache.register(app)
+
+# callback latency, payload and render cache counters on /metrics
+metrics.register(server)
+metrics.add_cache('charts', surgical_plots.charts)
+metrics.add_cache('maps', map_charts)
+if not CHART_BUNDLE:
+    metrics.add_partitions('datasets', partition_cache)
+
+# the numbers behind the charts on /api/v1/, for scripts; a bundle has
+# only charts, no data to answer from
+if not CHART_BUNDLE:
+    DataApi(surgical_plots, {authority: authority_name(authority)
+                             for authority in AUTHORITIES}, YEARS).register(server)
+
+# drops dashboard updates made redundant by newer ones from the same page,
+# e.g. the year slider stepped with the arrow keys
+dashboard_requests = RequestCoalescer()
+metrics.add_coalescer('update_dashboard', dashboard_requests)
 
 #### Title row ################################
 title_row = html.Div([
     dbc.Row([
-        html.H1('SURGICAL WAIT TIMES - BC', 
+        html.H1(page_title(DEFAULT_JURISDICTION), id='page_title',
         style={'background-color': '#000080', # navy blue 
                 'color': 'white', 
                 'font-weight': 'bolder', 
@@ -393,6 +831,7 @@ title_row = html.Div([
 
 #### health authority buttons row##############
 authority_buttons_row = html.Div([
+    dbc.Row([jurisdiction_dropdown]),
     dbc.Row([ha_buttons])
     ], 
     style={'color':'#000080',  # navy blue
@@ -518,6 +957,9 @@ style={'padding-top': "30px"})
 
 ########## layout ################################
 app.layout = dbc.Container([
+    # id of this page, set in the browser, for the server to tell which
+    # requests come from the same page
+    dcc.Store(id='page_session'),
     title_row,
     authority_buttons_row,
     main_row
@@ -525,83 +967,56 @@ app.layout = dbc.Container([
 
 
 ############## call backs ######################################################
-# 1st plot - callback
+# The authority buttons, year range and title of the selected jurisdiction.
+# Setting them fires update_dashboard once, with the jurisdiction changed.
 @app.callback(
-    Output("comp_prop_plot_id", 'srcDoc'),
     [
-        Input("year_slider", "value"),
-        Input("health_authority_buttons", "value")]
-)
-def update_comp_prop_plot(year, health_authority):
-    if health_authority == "Provincial":
-        health_authority = "Provincial Health Services Authority"
-    return surgical_plots.comp_prop_plot(year, health_authority)
-
-# 2nd plot - map
-
-
-@app.callback(
-    Output('map', 'srcDoc'),
-    Input('health_authority_buttons', 'value'))
-def update_map_image_plot(authority):
-    return map_image_plot(authority)
-
-# chainback dropdown - callback
-
-
-@app.callback(
-    [Output('hospital_dropdown', 'options'),
-     Output('hospital_dropdown', 'value')],
-    Input('health_authority_buttons', 'value'),
-)
-def set_hosp_dropdown(health_athority):
-
-    if(health_athority == "Provincial"):
-        health_athority = "Provincial Health Services Authority"
-    filtered_data = surgical_plots.count[surgical_plots.count.health_authority == health_athority]
-
-    dropdown_options = [{'label': c, 'value': c}
-                        for c in sorted(filtered_data.hospital.unique())]
-    #values_selected = [dropdown_options[0]]
-
-    return dropdown_options, dropdown_options[0]['label']
-
-# 4th plot - callback
-
-
-@app.callback(
-    Output("hosp_wait_comp_plot", 'srcDoc'),
-    [
-        Input("health_authority_buttons", "value"),
-        Input("year_slider", "value"),
-        Input("hospital_dropdown", "value")]
-)
-def update_wait_complete_plot(health_authority, year, hospname):
-    if(health_authority == "Provincial"):
-        health_authority = "Provincial Health Services Authority"
-
-    return surgical_plots.wait_complete_plot(health_authority, year, hospname)
-
-# 3rd plot - callback
-
-
-@app.callback(
-    Output("procedure_plot_id", 'srcDoc'),
-    [Input("health_authority_buttons", "value"),
-     Input("year_slider", "value"),
-     Input("fastest_slowest_treatments_buttons", "value")]
+        Output('health_authority_buttons', 'options'),
+        Output('health_authority_buttons', 'value'),
+        Output('year_slider', 'min'),
+        Output('year_slider', 'max'),
+        Output('year_slider', 'marks'),
+        Output('year_slider', 'value'),
+        Output('page_title', 'children')
+    ],
+    Input('jurisdiction_dropdown', 'value'),
+    prevent_initial_call=True
 )
-def update_procedure_plot(health_authority, year, pace):
-    if(pace == "Slowest"):
-        return surgical_plots.slowest_procedures(health_authority, year)
+@metrics.instrumented
+def select_jurisdiction(jurisdiction):
+    if jurisdiction not in jurisdictions:
+        raise PreventUpdate
+    if jurisdiction == DEFAULT_JURISDICTION:
+        authorities, years, value = AUTHORITIES, YEARS, DEFAULT_YEARS
+        authority = DEFAULT_AUTHORITY
     else:
-        return surgical_plots.fastest_procedures(health_authority, year)
-
-# score cards - callback
-
-
+        data = plots_for(jurisdiction).data
+        authorities, years = data.authorities(), data.years()
+        if not authorities:
+            raise PreventUpdate
+        # the default range's length, ending with the latest year
+        years = (years[0], years[-1])
+        value = [max(years[0], years[1] - (DEFAULT_YEARS[1] - DEFAULT_YEARS[0])), years[1]]
+        authority = authorities[0]
+    return ([{"label": name, "value": name} for name in authorities], authority,
+            years[0], years[1], year_marks(years), value, page_title(jurisdiction))
+
+
+# One callback updates the whole dashboard, so an interaction resolves the
+# authority and its rows once, only recomputes the outputs that depend on
+# what changed, and sets the hospital dropdown in the same round trip as the
+# hospital chart instead of firing that chart a second time. Before each
+# chart it checks whether newer requests from the page have made it
+# redundant, and if so stops without an update.
 @app.callback(
     [
+        chart_output("comp_prop_plot_id"),
+        chart_output('map'),
+        Output('hospital_dropdown', 'options'),
+        Output('hospital_dropdown', 'value'),
+        Output('wait_complete_job', 'data') if chart_jobs
+        else chart_output("hosp_wait_comp_plot"),
+        chart_output("procedure_plot_id"),
         Output('wait_cases_text', 'children'),
         Output('completed_cases_text', 'children'),
         Output('mean_waiting_time_50%_text', 'children'),
@@ -609,22 +1024,148 @@ def update_procedure_plot(health_authority, year, pace):
     ],
     [
         Input("health_authority_buttons", "value"),
-        Input("year_slider", "value")
-    ]
+        Input("year_range", "data"),
+        Input("fastest_slowest_treatments_buttons", "value"),
+        Input("hospital_dropdown", "value"),
+        Input("jurisdiction_dropdown", "value")
+    ],
+    [State('page_session', 'data')] +
+    ([State('wait_complete_job', 'data')] if chart_jobs else [])
 )
-def update_score_cards(health_authority, year):
-    if(health_authority == "Provincial"):
-        health_authority = "Provincial Health Services Authority"
-    filtered_data = surgical_plots.qdata[
-        (surgical_plots.qdata['health_authority'] == health_authority) &
-        (surgical_plots.qdata['year'] >= year[0]) &
-        (surgical_plots.qdata['year'] <= year[1])
-    ]
-    total_waiting = filtered_data['waiting'].sum()
-    total_completed = filtered_data['completed'].sum()
-    mean_wait_time_50 = filtered_data['wait_time_50'].mean()
-    mean_wait_time_90 = filtered_data['wait_time_90'].mean()
-    return total_waiting, total_completed, round(mean_wait_time_50), round(mean_wait_time_90)
+@metrics.instrumented
+def update_dashboard(authority, year, pace, hospname, jurisdiction, session, job=None):
+    if jurisdiction not in jurisdictions:
+        raise PreventUpdate
+    changed = {trigger['prop_id'].split('.')[0]
+               for trigger in dash.callback_context.triggered}
+    # the first call, when the page loads, has no triggering component
+    if changed == {''}:
+        changed = {"health_authority_buttons", "year_range",
+                   "fastest_slowest_treatments_buttons", "hospital_dropdown",
+                   "jurisdiction_dropdown"}
+    new_authority = bool(changed & {"health_authority_buttons", "jurisdiction_dropdown"})
+    new_year = new_authority or "year_range" in changed
+    new_hospital = new_year or "hospital_dropdown" in changed
+    new_pace = new_year or "fastest_slowest_treatments_buttons" in changed
+    health_authority = authority_name(authority)
+    # every output from one generation of the data
+    plots = plots_for(jurisdiction).snapshot()
+
+    request = dashboard_requests.start(session, changed)
+
+    # the outputs still to compute, when checking whether to stop
+    def superseded(*pending):
+        return dashboard_requests.is_superseded(request, sum(pending))
+
+    comp_prop = map_plot = options = wait_complete = procedure = dash.no_update
+    cards = [dash.no_update] * 4
+
+    # 2nd plot - map, and the chained hospital dropdown
+    if new_authority:
+        if jurisdiction == DEFAULT_JURISDICTION:
+            map_plot = map_image_plot(authority)
+        else:
+            map_plot = message_plot("No map for this jurisdiction")
+        options = [{'label': c, 'value': c}
+                   for c in plots.hospitals(health_authority)]
+        hospname = options[0]['label']
+
+    # 1st plot and score cards
+    if new_year:
+        if superseded(new_year, new_hospital, new_pace):
+            raise PreventUpdate
+        comp_prop = plots.comp_prop_plot(year, health_authority)
+        cards = plots.score_cards(health_authority, year)
+
+    # 4th plot, or with CHART_JOBS the job rendering it, which replaces the
+    # page's previous job if that has not started yet
+    if new_hospital:
+        if superseded(new_hospital, new_pace):
+            raise PreventUpdate
+        if chart_jobs:
+            args = [jurisdiction, health_authority, year, hospname]
+            wait_complete = {'id': chart_jobs.submit(
+                lambda: plots.wait_complete_plot(*args[1:]),
+                replaces=job and job['id']), 'args': args}
+        else:
+            wait_complete = plots.wait_complete_plot(
+                health_authority, year, hospname)
+
+    # 3rd plot
+    if new_pace:
+        if superseded(new_pace):
+            raise PreventUpdate
+        if(pace == "Slowest"):
+            procedure = plots.slowest_procedures(health_authority, year)
+        else:
+            procedure = plots.fastest_procedures(health_authority, year)
+
+    hosp_value = hospname if new_authority else dash.no_update
+    return [comp_prop, map_plot, options, hosp_value, wait_complete, procedure, *cards]
+
+
+# 4th plot from its background job: a placeholder unless the chart is done
+# within JOB_FIRST_WAIT, then the chart once a poll finds it finished
+if chart_jobs:
+    @app.callback(
+        [chart_output("hosp_wait_comp_plot"),
+         Output('wait_complete_poll', 'disabled')],
+        [Input('wait_complete_job', 'data'),
+         Input('wait_complete_poll', 'n_intervals')]
+    )
+    @metrics.instrumented
+    def show_wait_complete(job, n_intervals):
+        if not job:
+            raise PreventUpdate
+        new_job = any(trigger['prop_id'] == 'wait_complete_job.data'
+                      for trigger in dash.callback_context.triggered)
+        if job['id'] not in chart_jobs:
+            # submitted by another worker process, render it here
+            jurisdiction, *args = job['args']
+            chart_jobs.submit(lambda: plots_for(jurisdiction).wait_complete_plot(*args),
+                              job_id=job['id'])
+        try:
+            done, chart = chart_jobs.result(
+                job['id'], timeout=JOB_FIRST_WAIT if new_job else 0)
+        except Exception:
+            logger.exception('rendering %s failed', job['args'])
+            return message_plot("Chart not available"), True
+        if done:
+            return chart, True
+        if new_job:
+            return message_plot("Loading..."), False
+        return dash.no_update, False
+
+
+# a random id for the page, once it has loaded
+app.clientside_callback(
+    ClientsideFunction(namespace='session', function_name='new_id'),
+    Output('page_session', 'data'),
+    Input('page_session', 'id'))
+
+
+# the year range the dashboard updates from, passed on from the slider in
+# the browser once it stops moving (assets/year_debounce.js); the Interval
+# polls until then
+app.clientside_callback(
+    ClientsideFunction(namespace='slider', function_name='debounce'),
+    [Output('year_range', 'data'), Output('year_debounce', 'disabled')],
+    [Input('year_slider', 'value'),
+     Input('year_debounce', 'n_intervals'),
+     Input('jurisdiction_dropdown', 'value')],
+    [State('year_range', 'data'),
+     State('year_debounce', 'interval')],
+    prevent_initial_call=True)
+
+
+# spec rendering - draw each chart's spec into its div on the client
+if CHART_RENDERING == 'spec':
+    for chart_id in ["comp_prop_plot_id", 'map', "procedure_plot_id", "hosp_wait_comp_plot"]:
+        app.clientside_callback(
+            ClientsideFunction(namespace='vega', function_name='embed'),
+            Output(chart_id, 'className'),
+            Input(chart_id + '_spec', 'data'),
+            State(chart_id, 'id'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,201 @@
+import json
+
+import pandas as pd
+from flask import Response, abort, jsonify, make_response, request, url_for
+
+from data_cache import METRICS
+from http_cache import content_etag, not_modified
+
+API_PREFIX = '/api/v1/'
+# rows per page of a JSON answer, unless the request asks for fewer
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+MAX_PROCEDURES = 100
+MIMETYPES = {'json': 'application/json', 'csv': 'text/csv',
+             'ndjson': 'application/x-ndjson'}
+
+
+def _bad_request(message, status=400):
+    abort(make_response(jsonify(error=message), status))
+
+
+def _int_arg(name, default, low=None, high=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        _bad_request(f'{name} must be an integer, not {value!r}')
+    if (low is not None and value < low) or (high is not None and value > high):
+        _bad_request(f'{name} must be between {low} and {high}')
+    return value
+
+
+def _records(frame):
+    # python scalars, with None for missing values (JSON has no NaN)
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+class DataApi:
+    """The numbers behind the dashboard's charts as JSON, CSV or NDJSON, read
+    with the query methods of ``plots`` (a SurgicalPlots) and never drawn.
+
+    Routes, all GET, under API_PREFIX:
+
+    - ``authorities``: each authority's name in the data and its hospitals
+    - ``completion``: completed and waiting cases and completion ratio of an
+      authority by quarter
+    - ``procedures``: the ``k`` fastest and slowest procedures of an
+      authority by ``metric`` (wait_time_90 unless given)
+    - ``hospitals``: waiting and completed cases by quarter of every hospital,
+      of one ``authority`` or one ``hospital`` of it if given
+    - ``forecasts``: the projected waiting and completed cases and wait
+      times, with their intervals, of the next quarters of every hospital
+      and procedure, of one ``authority``, ``hospital`` or ``procedure`` if
+      given (no year range)
+
+    ``authority`` is a button label of the dashboard or the name in the data,
+    ``start`` and ``end`` the inclusive year range (the slider's if left out).
+    ``format=json`` (the default) answers one page of ``limit`` rows from
+    ``offset``, with the total and the URL of the next page; ``csv`` and
+    ``ndjson`` stream every row, one table at a time. JSON pages get the
+    content-hash ETags of http_cache; streams an ETag of the data generation
+    and query, so either is answered with a 304 while the data is unchanged.
+    """
+
+    def __init__(self, plots, authorities, years):
+        self.plots = plots
+        # button label -> name in the data
+        self.authorities = dict(authorities)
+        self.years = years
+
+    def _authority(self, required=True):
+        authority = request.args.get('authority')
+        if authority is None:
+            if required:
+                _bad_request('authority is required')
+            return None
+        authority = self.authorities.get(authority, authority)
+        if authority not in self.authorities.values():
+            _bad_request(f'unknown authority {authority!r}', 404)
+        return authority
+
+    def _year(self):
+        first, last = self.years
+        start = _int_arg('start', first, first, last)
+        end = _int_arg('end', last, start, last)
+        return [start, end]
+
+    def _answer(self, columns, tables):
+        """Respond with the rows of the DataFrames ``tables`` yields, each
+        with ``columns``, in the requested format."""
+        format = request.args.get('format', 'json')
+        if format not in MIMETYPES:
+            _bad_request(f'format must be one of {", ".join(MIMETYPES)}')
+        if format == 'json':
+            limit = _int_arg('limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+            offset = _int_arg('offset', 0, 0)
+            rows = pd.concat([pd.DataFrame(columns=columns), *tables],
+                             ignore_index=True)
+            next_page = None
+            if offset + limit < len(rows):
+                args = dict(request.args.to_dict(), offset=offset + limit)
+                next_page = url_for(request.endpoint, **args)
+            return jsonify(total=len(rows), offset=offset, limit=limit,
+                           next=next_page,
+                           rows=_records(rows.iloc[offset:offset + limit]))
+
+        def stream():
+            if format == 'csv':
+                yield pd.DataFrame(columns=columns).to_csv(index=False)
+            for table in tables:
+                if not len(table):
+                    continue
+                if format == 'csv':
+                    yield table[columns].to_csv(index=False, header=False)
+                else:
+                    yield ''.join(json.dumps(record) + '\n'
+                                  for record in _records(table[columns]))
+
+        generation = self.plots.data.generation
+        etag = generation and content_etag(
+            f'{generation} {request.full_path}'.encode('utf-8'))
+        if etag and not_modified(etag):
+            response = Response(status=304)
+        else:
+            response = Response(stream(), mimetype=MIMETYPES[format])
+        if etag:
+            response.set_etag(etag)
+        return response
+
+    def list_authorities(self):
+        return jsonify(authorities=[
+            {'authority': label, 'health_authority': name,
+             'hospitals': self.plots.hospitals(name)}
+            for label, name in self.authorities.items()])
+
+    def completion(self):
+        authority = self._authority()
+        rows = self.plots.data_compprop(self._year(), authority)
+        return self._answer(['health_authority', 'year', 'quarter', 'waiting',
+                             'completed', 'ratio'], [rows])
+
+    def procedures(self):
+        authority = self._authority()
+        year = self._year()
+        metric = request.args.get('metric', 'wait_time_90')
+        if metric not in METRICS:
+            _bad_request(f'cannot rank procedures by {metric!r}')
+        k = _int_arg('k', 5, 1, MAX_PROCEDURES)
+        ranking = self.plots.filtering(authority, year, metric, k)
+        # ranked from the fastest and from the slowest procedure
+        fastest, slowest = ranking.fastest, ranking.slowest.iloc[::-1]
+        tables = [fastest.assign(pace='fastest', rank=range(1, len(fastest) + 1)),
+                  slowest.assign(pace='slowest', rank=range(1, len(slowest) + 1))]
+        return self._answer(['pace', 'rank', 'procedure', *METRICS], tables)
+
+    def hospitals(self):
+        authority = self._authority(required=False)
+        hospital = request.args.get('hospital')
+        if hospital is not None and authority is None:
+            _bad_request('hospital needs its authority')
+        if hospital is not None and hospital not in self.plots.hospitals(authority):
+            _bad_request(f'{authority} has no hospital {hospital!r}', 404)
+        year = self._year()
+
+        def tables():
+            for name in [authority] if authority else self.authorities.values():
+                for cases in self.plots.hospital_cases(
+                        name, year, None if hospital is None else [hospital]):
+                    yield cases.assign(health_authority=name)
+        return self._answer(['health_authority', 'hospital', 'year', 'quarter',
+                             'waiting', 'completed'], tables())
+
+    def forecasts(self):
+        authority = self._authority(required=False)
+        hospital = request.args.get('hospital')
+        procedure = request.args.get('procedure')
+        if hospital is not None and authority is None:
+            _bad_request('hospital needs its authority')
+        if hospital is not None and hospital not in self.plots.hospitals(authority):
+            _bad_request(f'{authority} has no hospital {hospital!r}', 404)
+        forecasts = self.plots.data.forecasts
+        if forecasts is None:
+            _bad_request('no forecasts for this data', 404)
+        columns = ['health_authority', 'hospital', 'procedure', 'year', 'quarter']
+        for metric in METRICS:
+            columns += [metric, f'{metric}_lower', f'{metric}_upper']
+
+        def tables():
+            for name in [authority] if authority else self.authorities.values():
+                yield forecasts.table(name, hospital, procedure)
+        return self._answer(columns, tables())
+
+    def register(self, server):
+        for route, view in [('authorities', self.list_authorities),
+                            ('completion', self.completion),
+                            ('procedures', self.procedures),
+                            ('hospitals', self.hospitals),
+                            ('forecasts', self.forecasts)]:
+            server.add_url_rule(API_PREFIX + route, 'api_' + route, view)
@@ -0,0 +1,442 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# every quarterly release dropped into DATA_DIR is loaded by the dashboard
+DATA_DIR = 'data'
+SOURCE_PATTERN = '*-quarterly-surgical_wait_times*.xlsx'
+CACHE_DIR = 'data/cache'
+
+# bump whenever the cleaning steps or the on-disk layout change
+CACHE_VERSION = 4
+
+COLUMN_NAMES = {'fiscal_year': 'year',
+                'hospital_name': 'hospital',
+                'procedure_group': 'procedure',
+                'completed_50th_percentile': 'wait_time_50',
+                'completed_90th_percentile': 'wait_time_90'}
+CATEGORY_COLUMNS = ['quarter', 'health_authority', 'hospital', 'procedure']
+# the values of each row, which every backend sums, averages and ranks by
+METRICS = ['waiting', 'completed', 'wait_time_50', 'wait_time_90']
+NUMERIC_COLUMNS = {'year': 'int16',
+                   **dict.fromkeys(METRICS, 'float64'),
+                   'waiting_suppressed': 'bool',
+                   'completed_suppressed': 'bool'}
+# counts published as '<5', flagged before they are replaced by 3
+SUPPRESSED_COLUMNS = {'waiting': 'waiting_suppressed',
+                      'completed': 'completed_suppressed'}
+# column order of the cleaned table, the workbook columns then the flags
+COLUMNS = ['year', 'quarter', 'health_authority', 'hospital', 'procedure',
+           *METRICS, 'waiting_suppressed', 'completed_suppressed']
+# workbook rows parsed at a time, and column values copied at a time when
+# the cache files are finished: what bounds the memory of an ingest
+BATCH_ROWS = 20000
+COPY_ROWS = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+def _precedence(path):
+    # final releases replace interim ones, later interim quarters (q3 after
+    # q2) replace earlier ones, and ties go to the newest file
+    name = os.path.basename(path)
+    interim = re.search(r'-q(\d)-interim', name)
+    return (interim is None,
+            int(interim.group(1)) if interim else 0,
+            os.stat(path).st_mtime_ns)
+
+
+def discover_sources(data_dir=DATA_DIR):
+    """Quarterly workbooks in ``data_dir``, lowest precedence first."""
+    paths = [path for path in glob.glob(os.path.join(data_dir, SOURCE_PATTERN))
+             if not os.path.basename(path).startswith('~$')]
+    return sorted(paths, key=_precedence)
+
+
+def _header(cells):
+    # the workbook's column names as the cleaned table names them
+    names = [COLUMN_NAMES.get(name, name)
+             for name in (str(cell).lower() for cell in cells)]
+    missing = [column for column in COLUMNS
+               if column not in names and column not in SUPPRESSED_COLUMNS.values()]
+    if missing:
+        raise ValueError(f'workbook has no {", ".join(missing)} column')
+    return names
+
+
+def read_workbook(path, batch_rows=BATCH_ROWS):
+    """Cleaned tables of ``batch_rows`` rows of one quarterly workbook, in
+    order, read with openpyxl's read-only mode so only one batch of the
+    sheet is held at a time, with the dashboard's column names, a numeric
+    year and the '<5' suppressed counts set to 3 (and flagged in the
+    ``*_suppressed`` columns)."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        names = _header(next(rows, ()))
+
+        def cleaned(batch):
+            # empty cells as NaN, as pandas reads them
+            frame = pd.DataFrame.from_records(batch, columns=names)
+            return _clean(frame.where(frame.notna(), np.nan))
+
+        batch = []
+        batches = 0
+        for row in rows:
+            # rows left empty, typically below the table
+            if all(cell is None for cell in row):
+                continue
+            batch.append(row)
+            if len(batch) == batch_rows:
+                yield cleaned(batch)
+                batches += 1
+                batch = []
+        if batch or not batches:
+            yield cleaned(batch)
+    finally:
+        workbook.close()
+
+
+def _clean(data):
+    # rows without a fiscal year, quarter or health authority belong in no
+    # table the dashboard shows
+    data = data.dropna(subset=['year', 'quarter', 'health_authority'])
+
+    # Format year column, "2021/22" -> 2021
+    data['year'] = data['year'].astype(str).str.replace('(/).*', "", regex=True)
+    data['year'] = pd.to_numeric(data['year'])
+
+    # convert <5 string to median value of 3
+    for column, flag in SUPPRESSED_COLUMNS.items():
+        data[flag] = data[column].eq('<5')
+    data = data.replace('<5', 3)
+    for column, dtype in NUMERIC_COLUMNS.items():
+        data[column] = pd.to_numeric(data[column]).astype(dtype)
+    # empty cells stay missing, not the string "nan"
+    for column in CATEGORY_COLUMNS:
+        data[column] = data[column].map(str, na_action='ignore')
+    return data[COLUMNS].reset_index(drop=True)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_path(path, cache_dir):
+    return os.path.join(cache_dir, os.path.basename(path) + '.json')
+
+
+def _read_manifest(path, cache_dir):
+    try:
+        with open(_manifest_path(path, cache_dir)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+    if not os.path.isdir(os.path.join(cache_dir, manifest['dir'])):
+        return None
+    return manifest
+
+
+def _write_json(obj, target):
+    # write next to the target and rename so readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, target)
+
+
+class _ColumnWriter:
+    """Appends cleaned batches to one raw file per column in ``target``, then
+    turns them into the .npy files read_cache maps, with string columns as
+    the smallest integer codes of their sorted categories (-1 for a missing
+    value, as pandas codes it). Holds one batch and the distinct strings,
+    never a whole column."""
+
+    def __init__(self, target):
+        self.target = target
+        self.rows = 0
+        # string -> code in order of appearance, until the end; -1 for none
+        self.codes = {column: {} for column in CATEGORY_COLUMNS}
+        self.files = {column: open(self._raw(column), 'wb') for column in COLUMNS}
+
+    def _raw(self, column):
+        return os.path.join(self.target, column + '.raw')
+
+    def _dtype(self, column):
+        return 'int32' if column in CATEGORY_COLUMNS else NUMERIC_COLUMNS[column]
+
+    def append(self, batch):
+        for column in COLUMNS:
+            if column in CATEGORY_COLUMNS:
+                codes = self.codes[column]
+                values = np.fromiter(
+                    (codes.setdefault(value, len(codes)) if isinstance(value, str) else -1
+                     for value in batch[column]),
+                    dtype='int32', count=len(batch))
+            else:
+                values = batch[column].to_numpy(dtype=self._dtype(column))
+            self.files[column].write(values.tobytes())
+        self.rows += len(batch)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def finish(self):
+        """Write the .npy files and return the categories of the string
+        columns."""
+        self.close()
+        categories = {}
+        for column in COLUMNS:
+            remap = None
+            dtype = np.dtype(self._dtype(column))
+            if column in CATEGORY_COLUMNS:
+                codes = self.codes[column]
+                categories[column] = sorted(codes)
+                # one more entry, the last, which the missing values' -1 picks;
+                # signed even without a string, when only -1 is stored
+                remap = np.full(len(codes) + 1, -1,
+                                np.min_scalar_type(-max(len(codes), 1)))
+                remap[[codes[value] for value in categories[column]]] = \
+                    np.arange(len(codes))
+                dtype = remap.dtype
+            path = os.path.join(self.target, column + '.npy')
+            if self.rows == 0:
+                np.save(path, np.empty(0, dtype))
+            else:
+                raw = np.memmap(self._raw(column), dtype=self._dtype(column),
+                                mode='r', shape=(self.rows,))
+                values = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                                   shape=(self.rows,))
+                for start in range(0, self.rows, COPY_ROWS):
+                    chunk = raw[start:start + COPY_ROWS]
+                    values[start:start + COPY_ROWS] = chunk if remap is None else remap[chunk]
+                values.flush()
+                del raw, values
+            os.remove(self._raw(column))
+        return categories
+
+
+def build_cache(path, cache_dir=CACHE_DIR, sha256=None):
+    """Parse ``path`` and write its cleaned columns to ``cache_dir``, a batch
+    of rows at a time."""
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(path)
+    if sha256 is None:
+        sha256 = file_sha256(path)
+
+    name = f'{os.path.basename(path)}-v{CACHE_VERSION}-{sha256[:16]}'
+    target = os.path.join(cache_dir, name)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.build-')
+    try:
+        writer = _ColumnWriter(tmp)
+        try:
+            for batch in read_workbook(path):
+                writer.append(batch)
+        finally:
+            writer.close()
+        categories = writer.finish()
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # another worker finished the same build first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    manifest = {'version': CACHE_VERSION,
+                'source': os.path.basename(path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256,
+                'rows': writer.rows,
+                'dir': name,
+                'categories': categories}
+    previous = _read_manifest(path, cache_dir)
+    _write_json(manifest, _manifest_path(path, cache_dir))
+
+    # drop the columns of earlier versions of this workbook but the one it
+    # replaces, which workers not reloaded yet may still read
+    prefix = os.path.basename(path) + '-'
+    kept = {name, previous and previous['dir']}
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(prefix) and entry not in kept:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    return manifest
+
+
+def cached_manifest(path, cache_dir=CACHE_DIR):
+    """Return a manifest for ``path`` whose cache matches the workbook on
+    disk, rebuilding the cache when the workbook has changed."""
+    stat = os.stat(path)
+    manifest = _read_manifest(path, cache_dir)
+    if manifest is None:
+        return build_cache(path, cache_dir)
+    if (manifest['size'], manifest['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return manifest
+
+    # the mtime moved, only rebuild if the contents did too
+    sha256 = file_sha256(path)
+    if sha256 != manifest['sha256']:
+        return build_cache(path, cache_dir, sha256)
+    manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    _write_json(manifest, _manifest_path(path, cache_dir))
+    return manifest
+
+
+def source_manifests(paths, cache_dir=CACHE_DIR):
+    """The cached_manifest of each workbook of ``paths``: passed as
+    ``manifests`` to the functions below, they read these versions of the
+    workbooks' columns, whatever is on disk by then."""
+    return [cached_manifest(path, cache_dir) for path in paths]
+
+
+def manifest_digest(manifests):
+    """Short digest of the contents of the workbooks of ``manifests``, in
+    order, and of the cache version: what load_wait_times returns for them
+    depends on nothing else."""
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode())
+    for manifest in manifests:
+        digest.update(f"{manifest['source']}:{manifest['sha256']};".encode())
+    return digest.hexdigest()[:16]
+
+
+def source_digest(paths, cache_dir=CACHE_DIR):
+    """manifest_digest of the workbooks ``paths`` as they are now."""
+    return manifest_digest(source_manifests(paths, cache_dir))
+
+
+def read_cache(manifest, cache_dir=CACHE_DIR):
+    """Load the cleaned table described by ``manifest``; numeric columns are
+    memory-mapped read-only straight from the .npy files and string columns
+    become categoricals over the stored codes."""
+    folder = os.path.join(cache_dir, manifest['dir'])
+    columns = {}
+    for column in COLUMNS:
+        values = np.load(os.path.join(folder, column + '.npy'), mmap_mode='r')
+        if column in CATEGORY_COLUMNS:
+            values = pd.Categorical.from_codes(
+                values, categories=manifest['categories'][column])
+        columns[column] = values
+    return pd.DataFrame(columns, columns=COLUMNS, copy=False)
+
+
+def row_flags(frame):
+    """Which rows of a cleaned table are hospital and procedure detail (not
+    an "All ..." total, nor missing its hospital or procedure), and which of
+    those every analysis uses: no missing value and not Cataract Surgery, a
+    unique high volume procedure often performed in separate OR facilities."""
+    detail = ~(frame['procedure'].eq("All Procedures") |
+               frame['hospital'].eq("All Facilities") |
+               frame['health_authority'].eq("All Health Authorities")) & \
+        frame['hospital'].notna() & frame['procedure'].notna()
+    analysed = detail & frame.notna().all(axis=1) & \
+        frame['procedure'].ne("Cataract Surgery")
+    return detail, analysed
+
+
+def drop_superseded(frames):
+    """Keep every (year, quarter) only from the last frame that has it, so an
+    interim quarter is replaced once its final release is loaded."""
+    kept = []
+    covered = pd.MultiIndex.from_arrays([[], []], names=['year', 'quarter'])
+    for frame in reversed(frames):
+        periods = pd.MultiIndex.from_arrays([frame['year'], frame['quarter']])
+        kept.append(frame[~periods.isin(covered)])
+        covered = covered.union(periods.unique())
+    return kept[::-1]
+
+
+def wait_time_frames(paths=None, cache_dir=CACHE_DIR, year=None, manifests=None):
+    """The rows load_wait_times returns, as one table per workbook memory-
+    mapped from the columnar cache, for reading them without a copy. With
+    ``year`` each table is cut to that fiscal year before anything else, so
+    only its rows are copied."""
+    if manifests is None:
+        manifests = source_manifests(discover_sources() if paths is None else paths,
+                                     cache_dir)
+    frames = [read_cache(manifest, cache_dir) for manifest in manifests]
+    if year is not None:
+        frames = [frame[frame['year'].to_numpy() == year] for frame in frames]
+    return drop_superseded(frames)
+
+
+def load_wait_times(paths=None, cache_dir=CACHE_DIR, year=None, manifests=None):
+    """Cleaned quarterly wait times of all ``paths`` (by default every
+    workbook in DATA_DIR), or of fiscal ``year`` only, served from the
+    columnar cache so only new or changed workbooks are parsed; or of the
+    workbook versions ``manifests`` pins (see source_manifests)."""
+    frames = wait_time_frames(paths, cache_dir, year, manifests)
+
+    # share one set of categories so the concatenated columns stay categorical
+    dtypes = {column: pd.CategoricalDtype(sorted(set().union(
+        *(frame[column].cat.categories for frame in frames))))
+        for column in CATEGORY_COLUMNS}
+    frames = [frame.astype(dtypes) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+class SourceWatcher(threading.Thread):
+    """Polls ``data_dir`` and calls ``on_change`` once a quarterly workbook has
+    been added, removed or modified; a failed ``on_change`` is retried on the
+    next poll."""
+
+    def __init__(self, on_change, data_dir=DATA_DIR, interval=60):
+        super().__init__(name='source-watcher', daemon=True)
+        self.on_change = on_change
+        self.data_dir = data_dir
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def snapshot(self):
+        snapshot = {}
+        for path in discover_sources(self.data_dir):
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def run(self):
+        seen = previous = self.snapshot()
+        while not self._stopped.wait(self.interval):
+            try:
+                current = self.snapshot()
+                # wait for one quiet interval so a workbook still being
+                # copied in is not parsed half-written
+                if current != seen and current == previous:
+                    logger.info('quarterly workbooks changed, reloading')
+                    self.on_change()
+                    seen = current
+                previous = current
+            except Exception:
+                logger.exception('reloading quarterly workbooks failed')
+
+    def stop(self):
+        self._stopped.set()
+
+
+if __name__ == '__main__':
+    # ingest step, run once at deploy time so workers start from the cache
+    from partitions import discover_jurisdictions
+
+    for jurisdiction in discover_jurisdictions(None).values():
+        for source in discover_sources(jurisdiction.data_dir):
+            manifest = cached_manifest(source, jurisdiction.cache_dir)
+            print(f"{manifest['source']}: {manifest['rows']} rows "
+                  f"-> {os.path.join(jurisdiction.cache_dir, manifest['dir'])}")
@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+
+from data_cache import (CACHE_DIR, METRICS, discover_sources, manifest_digest, row_flags,
+                        source_manifests, wait_time_frames)
+
+# bump when what build_forecasts stores changes
+FORECAST_VERSION = 1
+# quarters projected past the last one in the data
+FORECAST_QUARTERS = 4
+# the latest quarters a series is fitted on, and how many of them it needs
+FIT_QUARTERS = 12
+MIN_QUARTERS = 6
+# damps the trend and seasonal terms of short or noisy series
+RIDGE = 0.1
+# half-width of the interval around a forecast, in residual standard
+# deviations (an 80% interval for normal errors)
+INTERVAL_Z = 1.2816
+KEYS = ['health_authority', 'hospital', 'procedure']
+# of the METRICS, wait times are only taken from the rows the procedure
+# ranking uses (no Cataract Surgery, no gaps), the counts from every
+# hospital/procedure row
+WAIT_METRICS = ['wait_time_50', 'wait_time_90']
+
+
+def fit_forecast(values, phases, horizon, ridge=RIDGE, min_points=MIN_QUARTERS):
+    """Forecasts of every row of ``values`` (series by periods, NaN where
+    missing) for the ``horizon`` periods after the last column.
+
+    Each series gets a least-squares line plus a term per season, the season
+    of each period and of the horizon given by ``phases`` (length periods +
+    horizon). All series are fitted at once: the normal equations are built
+    with one einsum over the observed-values mask and solved as a stack.
+    Returns the forecasts and their residual standard deviations; series
+    with fewer than ``min_points`` values get NaN.
+    """
+    series, periods = values.shape
+    seasons = int(phases.max()) + 1
+    observed = ~np.isnan(values)
+    y = np.where(observed, values, 0.0)
+
+    # intercept, trend in years from the last period, and a dummy per
+    # season but the first
+    trend = (np.arange(periods + horizon) - (periods - 1)) / seasons
+    design = np.column_stack([np.ones_like(trend), trend,
+                              np.eye(seasons)[phases][:, 1:]])
+    fit, ahead = design[:periods], design[periods:]
+    terms = design.shape[1]
+
+    weights = observed.astype('float64')
+    normal = np.einsum('tp,st,tq->spq', fit, weights, fit)
+    # a little on the intercept too, so series without values still solve
+    normal += np.diag([1e-9] + [ridge] * (terms - 1))
+    coefficients = np.linalg.solve(normal, np.einsum('tp,st->sp', fit, y)[..., None])[..., 0]
+
+    points = weights.sum(axis=1)
+    residuals = (y - coefficients @ fit.T) * weights
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(points - terms, 1))
+    forecast = coefficients @ ahead.T
+    unfit = points < min_points
+    forecast[unfit] = np.nan
+    sigma[unfit] = np.nan
+    return forecast, sigma
+
+
+def _codes(column, labels):
+    # codes of ``column``'s values in the sorted ``labels``
+    column = column.astype('category')
+    return pd.Index(labels).get_indexer(column.cat.categories)[column.cat.codes]
+
+
+def build_forecasts(frames, horizon=FORECAST_QUARTERS, window=FIT_QUARTERS):
+    """Metadata and arrays of the forecasts of every health authority,
+    hospital and procedure series of the cleaned tables ``frames``, as
+    Forecasts.from_state reads them back and the column store keeps them.
+
+    Rows are read a table at a time, so only their keys, period and values
+    are held, never a copy of the tables.
+    """
+    labels = {key: sorted(set().union(*(frame[key].astype('category').cat.categories
+                                        for frame in frames))) for key in KEYS}
+    quarters = sorted(set().union(*(frame['quarter'].astype('category').cat.categories
+                                    for frame in frames)))
+    first_year = min(int(frame['year'].min()) for frame in frames if len(frame))
+
+    keys, periods, values = [], [], {metric: [] for metric in METRICS}
+    for frame in frames:
+        detail, analysed = row_flags(frame)
+        detail = detail.to_numpy()
+        analysed = analysed.to_numpy()[detail]
+        rows = frame[detail]
+        key = np.zeros(len(rows), dtype='int64')
+        for name in KEYS:
+            key = key * len(labels[name]) + _codes(rows[name], labels[name])
+        keys.append(key)
+        periods.append((rows['year'].to_numpy() - first_year) * len(quarters) +
+                       _codes(rows['quarter'], quarters))
+        for metric in METRICS:
+            column = rows[metric].to_numpy(dtype='float64')
+            if metric in WAIT_METRICS:
+                column = np.where(analysed, column, np.nan)
+            values[metric].append(column)
+
+    series_keys, series = np.unique(np.concatenate(keys), return_inverse=True)
+    period = np.concatenate(periods)
+    last = int(period.max())
+    start = max(last + 1 - window, 0)
+    recent = period >= start
+    cell = series[recent] * (last + 1 - start) + period[recent] - start
+    size = len(series_keys) * (last + 1 - start)
+    phases = np.arange(start, last + 1 + horizon) % len(quarters)
+
+    arrays = {}
+    for metric in METRICS:
+        column = np.concatenate(values[metric])[recent]
+        present = ~np.isnan(column)
+        sums = np.bincount(cell, np.where(present, column, 0), size)
+        counts = np.bincount(cell, present, size)
+        with np.errstate(invalid='ignore'):
+            matrix = (sums / counts).reshape(len(series_keys), -1)
+        forecast, sigma = fit_forecast(matrix, phases, horizon)
+        arrays[f'{metric}.forecast'] = np.maximum(forecast, 0)
+        arrays[f'{metric}.lower'] = np.maximum(forecast - INTERVAL_Z * sigma[:, None], 0)
+        arrays[f'{metric}.upper'] = np.maximum(forecast + INTERVAL_Z * sigma[:, None], 0)
+
+    # the series' keys back from the combined code
+    for name in reversed(KEYS):
+        arrays[name] = (series_keys % len(labels[name])).astype('int32')
+        series_keys = series_keys // len(labels[name])
+    meta = {'labels': labels,
+            'last': [first_year + last // len(quarters), quarters[last % len(quarters)]],
+            'periods': [[first_year + p // len(quarters), quarters[p % len(quarters)]]
+                        for p in range(last + 1, last + 1 + horizon)]}
+    return meta, arrays
+
+
+# the forecasts of the workbooks ``paths`` (by default those in data/), or
+# of the versions ``manifests`` pins, published to the column store next to
+# their prepared data, as a release of the line of their cache_dir; returns
+# the Forecasts
+def load_forecasts(store, paths=None, cache_dir=CACHE_DIR, manifests=None):
+    if manifests is None:
+        manifests = source_manifests(discover_sources() if paths is None else paths,
+                                     cache_dir)
+    digest = manifest_digest(manifests)
+    store.use_release(cache_dir, digest)
+    return Forecasts.from_state(*store.load(
+        f'wait-forecasts-v{FORECAST_VERSION}-{digest}',
+        lambda: build_forecasts(wait_time_frames(cache_dir=cache_dir, manifests=manifests)),
+        digest))
+
+
+class Forecasts:
+    """Forecasts of the next quarters of every hospital and procedure series,
+    with the projections the charts overlay built from them."""
+
+    @classmethod
+    def from_state(cls, meta, arrays):
+        forecasts = cls()
+        forecasts.labels = meta['labels']
+        forecasts.last = tuple(meta['last'])
+        forecasts.periods = pd.DataFrame(meta['periods'], columns=['year', 'quarter'])
+        forecasts.keys = {name: arrays[name] for name in KEYS}
+        forecasts.values = {metric: {bound: arrays[f'{metric}.{bound}']
+                                     for bound in ('forecast', 'lower', 'upper')}
+                            for metric in METRICS}
+        return forecasts
+
+    @classmethod
+    def build(cls, frames):
+        return cls.from_state(*build_forecasts(frames))
+
+    def _rows(self, **keys):
+        # series matching the given key labels
+        rows = np.ones(len(self.keys['hospital']), dtype=bool)
+        for name, label in keys.items():
+            if label is not None:
+                labels = self.labels[name]
+                code = labels.index(label) if label in labels else -1
+                rows &= self.keys[name] == code
+        return rows
+
+    def table(self, health_authority=None, hospital=None, procedure=None):
+        """Each matching series' forecast with its interval per metric, a
+        row per series and quarter; NaN for the metrics a series is too
+        short for, and no rows for one too short for all of them."""
+        fitted = np.zeros(len(self.keys['hospital']), dtype=bool)
+        for metric in METRICS:
+            fitted |= ~np.isnan(self.values[metric]['forecast'][:, 0])
+        rows = np.flatnonzero(fitted & self._rows(
+            health_authority=health_authority, hospital=hospital, procedure=procedure))
+        horizon = len(self.periods)
+        table = pd.DataFrame({name: np.array(self.labels[name], dtype=object)[
+            self.keys[name][rows]].repeat(horizon) for name in KEYS})
+        table['year'] = np.tile(self.periods['year'].to_numpy(), len(rows))
+        table['quarter'] = np.tile(self.periods['quarter'].to_numpy(), len(rows))
+        for metric in METRICS:
+            for bound, values in self.values[metric].items():
+                name = metric if bound == 'forecast' else f'{metric}_{bound}'
+                table[name] = values[rows].ravel()
+        return table
+
+    def authority_ratio(self, health_authority):
+        """Projected waiting and completed cases of an authority and its
+        completion ratio by quarter, summed over the series with both."""
+        waiting = self.values['waiting']['forecast']
+        completed = self.values['completed']['forecast']
+        rows = self._rows(health_authority=health_authority) & \
+            ~np.isnan(waiting).any(axis=1) & ~np.isnan(completed).any(axis=1)
+        ratio = self.periods.assign(waiting=waiting[rows].sum(axis=0),
+                                    completed=completed[rows].sum(axis=0))
+        with np.errstate(invalid='ignore'):
+            ratio['ratio'] = ratio['completed'] / (ratio['completed'] + ratio['waiting'])
+        return ratio[ratio['waiting'] + ratio['completed'] > 0]
+
+    def procedure_means(self, health_authority, metric):
+        """Projected ``metric`` of each procedure of an authority, the mean
+        over the next quarters of the mean over its hospitals, as the
+        procedure ranking averages the past."""
+        forecast = self.values[metric]['forecast']
+        rows = self._rows(health_authority=health_authority) & \
+            ~np.isnan(forecast).any(axis=1)
+        codes = self.keys['procedure'][rows]
+        size = len(self.labels['procedure'])
+        counts = np.bincount(codes, minlength=size)
+        sums = np.bincount(codes, forecast[rows].mean(axis=1), minlength=size)
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({'procedure': np.array(self.labels['procedure'],
+                                                   dtype=object)[present],
+                             metric: sums[present] / counts[present]})
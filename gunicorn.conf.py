@@ -0,0 +1,14 @@
+# read by gunicorn from the working directory, see the Procfile
+
+# import dash_code, and with it the data, once in the master; the workers
+# forked from it share those pages copy-on-write instead of each loading
+# the data again
+preload_app = True
+threads = 4
+
+
+def when_ready(server):
+    # with preload_app this runs in the master after the import and before
+    # the workers are forked, so they start with the page-load charts cached
+    import dash_code
+    dash_code.warm_up()
@@ -0,0 +1,66 @@
+import hashlib
+
+from flask import request
+from flask_compress import Compress
+
+# brotli where the browser accepts it, gzip otherwise; flask-compress skips
+# bodies under COMPRESS_MIN_SIZE and types that do not compress (the PNGs)
+COMPRESS_ALGORITHMS = ['br', 'gzip']
+# streamed responses (the data API's CSV and NDJSON exports) can only be
+# compressed as they are written with brotli
+COMPRESS_STREAMING_ALGORITHMS = ['br']
+COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/javascript',
+                      'application/javascript', 'application/json', 'text/csv',
+                      'application/x-ndjson', 'image/svg+xml']
+COMPRESS_BR_LEVEL = 5
+COMPRESS_LEVEL = 6
+
+
+def content_etag(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def not_modified(etag):
+    """Whether the request's If-None-Match holds ``etag``."""
+    # compression appends ":<algorithm>" to the tags it sends, match on the
+    # content hash alone so a br response validates a gzip one and back
+    return etag in {tag.split(':', 1)[0] for tag in request.if_none_match}
+
+
+class ContentETags:
+    """Strong ETags from a hash of the uncompressed body of every GET or
+    HEAD response that does not set its own, with If-None-Match answered by
+    a 304.
+
+    Callback responses are POSTs, which browsers neither cache nor send
+    If-None-Match with (and a match would call for a 412, not a 304), so
+    they are not hashed.
+    """
+
+    def after_request(self, response):
+        if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+                or response.is_streamed or response.direct_passthrough
+                or response.get_etag()[0]):
+            return response
+        etag = content_etag(response.get_data())
+        response.set_etag(etag)
+        if not_modified(etag):
+            response.status_code = 304
+            response.set_data(b'')
+        return response
+
+    def register(self, server):
+        server.after_request(self.after_request)
+
+
+def register(app):
+    """Compress and tag the responses of the Dash ``app``'s server."""
+    server = app.server
+    server.config.update(COMPRESS_ALGORITHM=COMPRESS_ALGORITHMS,
+                         COMPRESS_ALGORITHM_STREAMING=COMPRESS_STREAMING_ALGORITHMS,
+                         COMPRESS_MIMETYPES=COMPRESS_MIMETYPES,
+                         COMPRESS_BR_LEVEL=COMPRESS_BR_LEVEL,
+                         COMPRESS_LEVEL=COMPRESS_LEVEL)
+    Compress(server)
+    # registered after Compress so it runs first, on the uncompressed body
+    ContentETags().register(server)
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from flask import Response, abort, request
+
+IMAGE_DIR = 'data/images'
+AUTHORITY_IMAGES = {"Interior": 'interior.png',
+                    "Fraser": 'fraser.png',
+                    "Vancouver Coastal": 'vancoastal.png',
+                    "Vancouver Island": 'vanisland.png',
+                    "Northern": 'northern.png',
+                    "Provincial": 'provincial.png'}
+ROUTE = '/maps/'
+
+
+class MapImages:
+    """The health authority maps, decoded, downscaled to the display size and
+    PNG-encoded once on first use, then served with an ETag and long-lived
+    cache headers."""
+
+    def __init__(self, image_dir=IMAGE_DIR, size=(400, 400)):
+        self.image_dir = image_dir
+        self.size = size
+        self.images = {}
+        self._lock = threading.Lock()
+
+    def _encode(self, filename):
+        from PIL import Image
+
+        with Image.open(os.path.join(self.image_dir, filename)) as img:
+            img.thumbnail(self.size)
+            with BytesIO() as buffer:
+                img.save(buffer, 'png', optimize=True)
+                data = buffer.getvalue()
+        return data, hashlib.sha256(data).hexdigest()[:16]
+
+    def image(self, filename):
+        """PNG bytes and ETag of ``filename``."""
+        with self._lock:
+            if filename not in self.images:
+                self.images[filename] = self._encode(filename)
+            return self.images[filename]
+
+    def url(self, authority):
+        # the content hash in the query string lets browsers cache it for good
+        filename = AUTHORITY_IMAGES[authority]
+        return f'{ROUTE}{filename}?v={self.image(filename)[1]}'
+
+    def serve(self, filename):
+        if filename not in AUTHORITY_IMAGES.values():
+            abort(404)
+        data, etag = self.image(filename)
+        response = Response(data, mimetype='image/png')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        return response.make_conditional(request)
+
+    def register(self, server):
+        server.add_url_rule(ROUTE + '<filename>', 'map_image', self.serve)
@@ -0,0 +1,210 @@
+import cProfile
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from dash.exceptions import PreventUpdate
+from flask import Response
+
+# fraction of callbacks run under cProfile, with stats dumped to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+# label values escaped as the text format requires: cache names include
+# jurisdiction directory names, which may hold any of these
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class Metrics:
+    """Per-callback latency, query/render split and payload size, plus the
+    counters of registered render caches, request coalescers and partition
+    caches, in Prometheus text format."""
+
+    def __init__(self):
+        self.latency = defaultdict(lambda: Histogram(SECONDS_BUCKETS))
+        self.phases = defaultdict(lambda: Histogram(SECONDS_BUCKETS))
+        self.payload = defaultdict(lambda: Histogram(BYTES_BUCKETS))
+        self.errors = defaultdict(int)
+        self.caches = {}
+        self.coalescers = {}
+        self.partitions = {}
+        self._lock = threading.Lock()
+        self._current = threading.local()
+
+    def add_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def add_coalescer(self, callback, coalescer):
+        self.coalescers[callback] = coalescer
+
+    def add_partitions(self, name, partitions):
+        self.partitions[name] = partitions
+
+    def instrumented(self, callback):
+        """Wrap a Dash callback to record its latency, payload and errors."""
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            self._current.callback = name
+            start = time.perf_counter()
+            try:
+                if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+                    result = self._profiled(name, callback, *args, **kwargs)
+                else:
+                    result = callback(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                with self._lock:
+                    self.errors[name] += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self._current.callback = None
+            size = len(json.dumps(result, default=str))
+            with self._lock:
+                self.latency[name].observe(elapsed)
+                self.payload[name].observe(size)
+            return result
+        return wrapper
+
+    def _profiled(self, name, callback, *args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(callback, *args, **kwargs)
+        finally:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            profiler.dump_stats(os.path.join(
+                PROFILE_DIR, f'{name}-{stamp}-{threading.get_ident()}.prof'))
+
+    def phase(self, phase):
+        """Decorator attributing a function's time to ``phase`` of whichever
+        instrumented callback is running on this thread."""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                name = getattr(self._current, 'callback', None)
+                if name is None:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with self._lock:
+                        self.phases[(name, phase)].observe(elapsed)
+            return wrapper
+        return decorate
+
+    def _histograms(self, lines, metric, description, histograms):
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for labels, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+    def render(self):
+        lines = []
+        with self._lock:
+            self._histograms(
+                lines, 'dash_callback_seconds', 'Callback latency in seconds.',
+                {_labels(callback=name): h for name, h in self.latency.items()})
+            self._histograms(
+                lines, 'dash_callback_phase_seconds',
+                'Time spent querying data and rendering charts per callback.',
+                {_labels(callback=name, phase=phase): h
+                 for (name, phase), h in self.phases.items()})
+            self._histograms(
+                lines, 'dash_callback_payload_bytes',
+                'Size of the JSON-encoded callback output.',
+                {_labels(callback=name): h for name, h in self.payload.items()})
+            lines.append('# HELP dash_callback_errors_total Callbacks that raised.')
+            lines.append('# TYPE dash_callback_errors_total counter')
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'dash_callback_errors_total{{{_labels(callback=name)}}} {count}')
+
+        stats = {name: cache.stats() for name, cache in self.caches.items()}
+        for key, kind, description in [
+                ('hits', 'counter', 'Render cache hits.'),
+                ('misses', 'counter', 'Render cache misses.'),
+                ('evictions', 'counter', 'Render cache evictions.'),
+                ('entries', 'gauge', 'Charts held by the render cache.'),
+                ('bytes', 'gauge', 'Bytes of chart output held by the render cache.')]:
+            metric = f'render_cache_{key}' + ('_total' if kind == 'counter' else '')
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, values in sorted(stats.items()):
+                lines.append(f'{metric}{{{_labels(cache=name)}}} {values[key]}')
+
+        stats = {name: c.stats() for name, c in self.coalescers.items()}
+        for key, metric, kind, description in [
+                ('requests', 'dash_coalescer_requests_total', 'counter',
+                 'Requests checked for newer ones from the same page.'),
+                ('superseded', 'dash_superseded_requests_total', 'counter',
+                 'Requests dropped because newer ones made them redundant.'),
+                ('skipped', 'dash_skipped_computations_total', 'counter',
+                 'Charts and score cards not computed for dropped requests.'),
+                ('sessions', 'dash_coalescer_sessions', 'gauge',
+                 'Pages whose latest requests are tracked.')]:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, values in sorted(stats.items()):
+                lines.append(f'{metric}{{{_labels(callback=name)}}} {values[key]}')
+
+        stats = {name: p.stats() for name, p in self.partitions.items()}
+        for key, kind, description in [
+                ('loads', 'counter', 'Data partitions loaded.'),
+                ('hits', 'counter', 'Queries of partitions already loaded.'),
+                ('evictions', 'counter', 'Loaded partitions dropped to stay in bounds.'),
+                ('resident', 'gauge', 'Data partitions held in memory.')]:
+            metric = f'partition_cache_{key}' + ('_total' if kind == 'counter' else '')
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, values in sorted(stats.items()):
+                lines.append(f'{metric}{{{_labels(cache=name)}}} {values[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def register(self, server, route='/metrics'):
+        server.add_url_rule(route, 'metrics', self.serve)
+
+
+metrics = Metrics()
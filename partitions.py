@@ -0,0 +1,229 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from aggregates import rank_means
+from data_cache import (CACHE_DIR, DATA_DIR, METRICS, discover_sources, manifest_digest,
+                        row_flags, source_manifests, wait_time_frames)
+from forecasting import load_forecasts
+
+# one subdirectory of workbooks per jurisdiction besides the default one
+JURISDICTIONS_DIR = os.path.join(DATA_DIR, 'jurisdictions')
+# bump when what build_catalog stores changes
+CATALOG_VERSION = 1
+# column types of the tables the cubes answer, for an empty answer
+TYPES = {'year': 'int64', **dict.fromkeys(METRICS, 'float64')}
+
+# name shown in the selector, where its workbooks are and where their
+# column cache goes
+Jurisdiction = namedtuple('Jurisdiction', ['name', 'data_dir', 'cache_dir'])
+
+
+def discover_jurisdictions(default, data_dir=DATA_DIR,
+                           jurisdictions_dir=JURISDICTIONS_DIR, cache_dir=CACHE_DIR):
+    """``{name: Jurisdiction}``: ``default`` for the workbooks in
+    ``data_dir``, then one per subdirectory of ``jurisdictions_dir`` that has
+    workbooks, named after it, with its own cache directory."""
+    jurisdictions = {default: Jurisdiction(default, data_dir, cache_dir)}
+    if os.path.isdir(jurisdictions_dir):
+        for name in sorted(os.listdir(jurisdictions_dir)):
+            folder = os.path.join(jurisdictions_dir, name)
+            if os.path.isdir(folder) and discover_sources(folder):
+                jurisdictions[name] = Jurisdiction(
+                    name, folder, os.path.join(cache_dir, 'jurisdictions', name))
+    return jurisdictions
+
+
+def build_catalog(frames):
+    """The fiscal years of the cleaned tables ``frames`` and the sorted
+    hospitals of each health authority, everything a jurisdiction needs
+    before a query touches its partitions."""
+    years = set()
+    hospitals = {}
+    for frame in frames:
+        years.update(int(year) for year in np.unique(frame['year']))
+        detail, _ = row_flags(frame)
+        pairs = frame.loc[detail.to_numpy(), ['health_authority', 'hospital']]
+        for authority, hospital in pairs.drop_duplicates().itertuples(index=False):
+            hospitals.setdefault(authority, set()).add(hospital)
+    return {'years': sorted(years),
+            'hospitals': {authority: sorted(names)
+                          for authority, names in sorted(hospitals.items())}}
+
+
+class PartitionCache:
+    """Bounded LRU of loaded partitions, shared by every jurisdiction so
+    ``max_partitions`` bounds what a worker holds however many it serves.
+
+    A partition is loaded outside the lock, once however many threads ask
+    for it at the same time. An evicted one is freed when the last query
+    still reading it finishes.
+    """
+
+    def __init__(self, max_partitions=32):
+        self.max_partitions = max_partitions
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                # loaded by the thread this one waited for
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+            try:
+                value = load()
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            with self._lock:
+                self.loads += 1
+                self._entries[key] = value
+                while len(self._entries) > self.max_partitions:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def keys(self):
+        """Keys of the resident partitions, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {'loads': self.loads,
+                    'hits': self.hits,
+                    'evictions': self.evictions,
+                    'resident': len(self._entries)}
+
+
+class PartitionedDataset:
+    """The queries of dash_code's Dataset over one jurisdiction, its data
+    partitioned by fiscal year.
+
+    Each year is a prepared dataset of its own in the column store,
+    published by the first process to need it and memory-mapped by the
+    others. ``load_partition(store, jurisdiction, manifests, digest, year)``
+    returns it, and is called the first time a query's year range touches
+    the year; ``cache`` keeps it resident until evicted. Until then only the
+    catalog (years, authorities and hospitals) is loaded, and the forecasts
+    only once something shows them. Answers are the Dataset's, added up
+    over the years (up to the order floating-point sums are added in).
+
+    The workbooks' manifests are pinned with the catalog: years and
+    forecasts loaded later read the columns of those versions, not whatever
+    is on disk by then, which only a reload (a new PartitionedDataset)
+    picks up once the SourceWatcher finds the workbooks settled. The column
+    cache keeps the versions it replaces once; pinned ones replaced twice
+    since raise FileNotFoundError until then.
+    """
+
+    def __init__(self, jurisdiction, store, cache, load_partition):
+        self.jurisdiction = jurisdiction
+        self.store = store
+        self.cache = cache
+        self.load_partition = load_partition
+        self.paths = discover_sources(jurisdiction.data_dir)
+        self.manifests = source_manifests(self.paths, jurisdiction.cache_dir)
+        self.digest = manifest_digest(self.manifests)
+        self.generation = f'wait-times-partitioned-{self.digest}'
+        # the jurisdiction's earlier releases but the previous one are dropped
+        store.use_release(jurisdiction.cache_dir, self.digest)
+
+        meta, _ = store.load(
+            f'wait-catalog-v{CATALOG_VERSION}-{self.digest}',
+            lambda: (build_catalog(wait_time_frames(
+                cache_dir=jurisdiction.cache_dir, manifests=self.manifests)), {}),
+            self.digest)
+        self.year_list = meta['years']
+        self.hospital_index = meta['hospitals']
+        self._forecasts = None
+        self._lock = threading.Lock()
+
+    @property
+    def forecasts(self):
+        with self._lock:
+            if self._forecasts is None:
+                self._forecasts = load_forecasts(
+                    self.store, cache_dir=self.jurisdiction.cache_dir, manifests=self.manifests)
+            return self._forecasts
+
+    def partitions(self, year):
+        """The loaded partitions of the inclusive ``[start, end]`` years."""
+        return [self.cache.get((self.digest, part), lambda part=part: self.load_partition(
+                    self.store, self.jurisdiction, self.manifests, self.digest, part))
+                for part in self.year_list if year[0] <= part <= year[1]]
+
+    def authorities(self):
+        return list(self.hospital_index)
+
+    def years(self):
+        return list(self.year_list)
+
+    def hospitals(self, health_authority):
+        return self.hospital_index.get(health_authority, [])
+
+    @staticmethod
+    def _empty(columns):
+        return pd.DataFrame({column: pd.Series(dtype=TYPES.get(column, object))
+                             for column in columns})
+
+    def _concat(self, tables, columns):
+        # a partition without the rows answers an untyped empty table
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return self._empty(columns)
+        return pd.concat(tables, ignore_index=True)
+
+    def hospital_cells(self, health_authority, hospital, year):
+        return self._concat(
+            [part.hospital_cells(health_authority, hospital, year)
+             for part in self.partitions(year)],
+            ['hospital', 'year', 'quarter', 'waiting', 'completed'])
+
+    def authority_cells(self, health_authority, year):
+        return self._concat(
+            [part.authority_cells(health_authority, year) for part in self.partitions(year)],
+            ['health_authority', 'year', 'quarter', 'waiting', 'completed'])
+
+    def totals(self, health_authority, year):
+        totals = dict.fromkeys(METRICS, 0.0)
+        counts = dict.fromkeys(METRICS, 0)
+        for part in self.partitions(year):
+            cube = part.authority_cube
+            for value in METRICS:
+                totals[value] += cube.total(health_authority, year, value)
+                counts[value] += cube.count(health_authority, year, value)
+        means = [totals[value] / counts[value] if counts[value] else np.nan
+                 for value in ('wait_time_50', 'wait_time_90')]
+        return (totals['waiting'], totals['completed'], *means)
+
+    def ranked_procedures(self, health_authority, year, metric, k):
+        if metric not in METRICS:
+            raise ValueError(f'cannot rank by {metric!r}')
+        sums = [part.procedure_cube.label_sums(health_authority, year)
+                for part in self.partitions(year)]
+        sums = [table for table in sums if len(table)]
+        if not sums:
+            empty = self._empty(['procedure'] + METRICS)
+            return empty, empty
+        # every year's labels, sorted as in one cube
+        labels = sorted(set().union(*(table.index for table in sums)))
+        sums = sum(table.reindex(labels, fill_value=0) for table in sums)
+        return rank_means('procedure', sums, METRICS, metric, k)
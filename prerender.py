@@ -0,0 +1,123 @@
+"""Prerender every chart the dashboard can show into a static bundle.
+
+    python prerender.py --output bundle [--workers 4] [--rendering html]
+    CHART_BUNDLE=bundle gunicorn dash_code:server
+
+Every health authority, year range of the slider, pace and hospital is
+rendered with the SurgicalPlots methods the callbacks use, spread over a
+process pool. Charts are written to ``<output>/charts`` under their content
+hash and ``<output>/index.json`` maps each set of callback inputs to its
+chart, score cards and hospital list. The index is written last, so an
+interrupted build leaves no usable bundle behind.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import combinations_with_replacement
+
+from chart_bundle import CHART_DIR, bundle_key, write_chart, write_index
+from data_cache import discover_sources, file_sha256
+
+dash_code = None
+
+
+def _load_app(rendering):
+    # the app module reads these at import, a bundle is built from the data
+    global dash_code
+    os.environ['CHART_RENDERING'] = rendering
+    os.environ['DATA_WATCH_INTERVAL'] = '0'
+    os.environ.pop('CHART_BUNDLE', None)
+    import dash_code as module
+    dash_code = module
+    return module
+
+
+def render_range(bundle_dir, authority, year):
+    """Charts and score cards of one authority and year range.
+
+    Returns the (key, file name) of every chart written and the score cards.
+    """
+    plots = dash_code.surgical_plots
+    render = dash_code.render_chart
+    rendering = dash_code.CHART_RENDERING
+    health_authority = dash_code.authority_name(authority)
+
+    charts = {
+        bundle_key('fastest', health_authority, year):
+            render(plots.fastest_chart(health_authority, year)),
+        bundle_key('slowest', health_authority, year):
+            render(plots.slowest_chart(health_authority, year)),
+        bundle_key('comp_prop', health_authority, year):
+            render(plots.comp_prop_chart(year, health_authority)),
+    }
+    for hospital in plots.hospitals(health_authority):
+        charts[bundle_key('wait_complete', health_authority, year, hospital)] = \
+            render(plots.wait_complete_chart(health_authority, year, hospital))
+
+    names = {key: write_chart(bundle_dir, content, rendering)
+             for key, content in charts.items()}
+    cards = plots.score_cards(health_authority, year)
+    return names, {bundle_key('cards', health_authority, year): list(cards)}
+
+
+def year_ranges(first, last):
+    return [[start, end] for start, end in
+            combinations_with_replacement(range(first, last + 1), 2)]
+
+
+def build(bundle_dir, rendering='html', workers=None):
+    module = _load_app(rendering)
+    os.makedirs(os.path.join(bundle_dir, CHART_DIR), exist_ok=True)
+
+    index = {'rendering': rendering,
+             'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+             'sources': {os.path.basename(path): file_sha256(path)
+                         for path in discover_sources()},
+             'hospitals': {},
+             'charts': {},
+             'score_cards': {}}
+    for authority in module.AUTHORITIES:
+        health_authority = module.authority_name(authority)
+        index['hospitals'][health_authority] = \
+            module.surgical_plots.hospitals(health_authority)
+        index['charts'][bundle_key('map', authority)] = write_chart(
+            bundle_dir, module.render_chart(module.map_image_chart(authority)),
+            rendering)
+
+    tasks = [(authority, year) for authority in module.AUTHORITIES
+             for year in year_ranges(*module.YEARS)]
+    with ProcessPoolExecutor(workers, initializer=_load_app,
+                             initargs=(rendering,)) as pool:
+        results = pool.map(render_range, [bundle_dir] * len(tasks),
+                           *zip(*tasks), chunksize=8)
+        for names, cards in results:
+            index['charts'].update(names)
+            index['score_cards'].update(cards)
+
+    write_index(bundle_dir, index)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='bundle', help='bundle directory')
+    parser.add_argument('--rendering', choices=['html', 'spec'], default='html',
+                        help='chart format, as CHART_RENDERING for the app')
+    parser.add_argument('--workers', type=int,
+                        help='processes to render with (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = build(args.output, args.rendering, args.workers)
+    files = len(set(index['charts'].values()))
+    print(f"{len(index['charts'])} charts ({files} distinct files) and "
+          f"{len(index['score_cards'])} score cards in {args.output}, "
+          f'{time.perf_counter() - start:.0f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
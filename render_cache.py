@@ -0,0 +1,117 @@
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+
+
+def _freeze(value):
+    # callback inputs arrive as lists (the year slider), keys must be hashable
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class RenderCache:
+    """Bounded LRU store for rendered chart output.
+
+    Entries are evicted least recently used first once either
+    ``max_entries`` or ``max_bytes`` (the summed length of the stored
+    strings) is exceeded. ``clear`` starts a new generation, so a render
+    that began before the clear is not stored afterwards.
+
+    ``generation`` pins a lookup to the generation the caller read its data
+    in (see ``pinned``): once the cache is past it the chart is rendered
+    but neither looked up nor stored.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render, generation=None):
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            if generation == self.generation and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = render()
+
+        with self._lock:
+            if generation == self.generation and key not in self._entries:
+                self._entries[key] = value
+                self._bytes += len(value)
+                self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            _, value = self._entries.popitem(last=False)
+            self._bytes -= len(value)
+            self.evictions += 1
+
+    def pinned(self):
+        """A view of this cache for charts of data read after this call,
+        which only shares entries with the cache until its next ``clear``."""
+        return PinnedRenderCache(self, self.generation)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'bytes': self._bytes,
+                    'generation': self.generation}
+
+
+class PinnedRenderCache:
+    """``get_or_render`` of a RenderCache, pinned to one of its generations."""
+
+    def __init__(self, cache, generation):
+        self.cache = cache
+        self.generation = generation
+
+    def get_or_render(self, key, render):
+        return self.cache.get_or_render(key, render, self.generation)
+
+
+def cached_render(kind, cache=None):
+    """Memoize a chart function on (kind, *its arguments).
+
+    Arguments are bound to the signature first, so keyword and positional
+    calls share entries. Without ``cache`` the function is a method and
+    the instance's ``charts`` cache is used.
+    """
+    def decorate(render):
+        signature = inspect.signature(render)
+
+        @functools.wraps(render)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = list(bound.arguments.values())
+            store = cache
+            if store is None:
+                store = arguments.pop(0).charts
+            key = (kind,) + _freeze(arguments)
+            return store.get_or_render(key, lambda: render(*args, **kwargs))
+        return wrapper
+    return decorate
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import top_k
+from data_cache import (CACHE_DIR, METRICS, discover_sources, row_flags, source_digest,
+                        wait_time_frames)
+
+SQLITE_DIR = os.path.join(CACHE_DIR, 'sqlite')
+# bump when the schema or what build_database stores changes
+SQLITE_VERSION = 2
+INSERT_ROWS = 50000
+
+SCHEMA = """
+CREATE TABLE wait_times (
+    year INTEGER NOT NULL,
+    quarter TEXT NOT NULL,
+    health_authority TEXT NOT NULL,
+    -- NULL where the workbook leaves them empty, never a detail row
+    hospital TEXT,
+    procedure TEXT,
+""" + ''.join(f'    {metric} REAL,\n' for metric in METRICS) + """    -- not an "All ..." total row
+    detail INTEGER NOT NULL,
+    -- a detail row with every value, not Cataract Surgery
+    analysed INTEGER NOT NULL
+)
+"""
+INDEXES = [
+    'CREATE INDEX authority_period ON wait_times (health_authority, year, quarter)',
+    'CREATE INDEX hospital_period ON wait_times '
+    '(health_authority, hospital, year, quarter)',
+    'CREATE INDEX procedure_period ON wait_times '
+    '(health_authority, procedure, year, quarter)',
+]
+
+
+def build_database(path, frames):
+    """Write the cleaned tables ``frames`` to a new SQLite database at
+    ``path``, INSERT_ROWS rows at a time, and index it."""
+    columns = ['year', 'quarter', 'health_authority', 'hospital', 'procedure', *METRICS]
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute(SCHEMA)
+        for frame in frames:
+            for start in range(0, len(frame), INSERT_ROWS):
+                chunk = frame.iloc[start:start + INSERT_ROWS]
+                detail, analysed = row_flags(chunk)
+                rows = chunk[columns].astype(object)
+                rows = rows.where(rows.notna(), None).assign(
+                    detail=detail.astype(int), analysed=analysed.astype(int))
+                connection.executemany(
+                    f'INSERT INTO wait_times VALUES ({", ".join("?" * (len(columns) + 2))})',
+                    rows.itertuples(index=False, name=None))
+        for index in INDEXES:
+            connection.execute(index)
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def load_sqlite(paths=None, db_dir=SQLITE_DIR, keep=2, forecasts=None,
+                cache_dir=CACHE_DIR):
+    """The SqliteDataset of the workbooks ``paths`` (by default every one in
+    DATA_DIR), building its database from their column cache in
+    ``cache_dir`` the first time, with their ``forecasts``
+    (forecasting.Forecasts) if given.
+
+    Databases are named after the sources like the column store's
+    generations, written to a temporary file and renamed into place; all
+    but the ``keep`` most recently used are removed.
+    """
+    if paths is None:
+        paths = discover_sources()
+    generation = f'wait-times-sqlite-v{SQLITE_VERSION}-{source_digest(paths, cache_dir)}'
+    path = os.path.join(db_dir, generation + '.sqlite')
+    if not os.path.exists(path):
+        os.makedirs(db_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=db_dir, prefix='.', suffix='.sqlite')
+        os.close(fd)
+        try:
+            build_database(tmp, wait_time_frames(paths, cache_dir))
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    os.utime(path)
+    # another worker reloading at the same time may remove them first
+    databases = []
+    for name in os.listdir(db_dir):
+        if name.endswith('.sqlite') and not name.startswith('.'):
+            try:
+                databases.append((os.stat(os.path.join(db_dir, name)).st_mtime_ns, name))
+            except FileNotFoundError:
+                pass
+    for _, old in sorted(databases, reverse=True)[keep:]:
+        try:
+            os.remove(os.path.join(db_dir, old))
+        except FileNotFoundError:
+            pass
+    return SqliteDataset(path, generation, forecasts)
+
+
+class SqliteDataset:
+    """The queries of dash_code's Dataset as indexed SQL over a database
+    written by build_database, for data that need not fit in memory.
+
+    Results match the cube queries (up to the order floating-point sums are
+    added in). Each thread of each process opens its own read-only
+    connection.
+    """
+
+    def __init__(self, path, generation=None, forecasts=None):
+        self.path = path
+        self.generation = generation
+        self.forecasts = forecasts
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        # a connection does not survive a fork, e.g. of a gunicorn master
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(
+                f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            local.pid = os.getpid()
+        return local.connection
+
+    def _query(self, sql, params):
+        frame = pd.read_sql_query(sql, self._connection(), params=params)
+        # the cubes' column types, which an empty result would not have
+        return frame.astype({column: 'int64' if column == 'year' else 'float64'
+                             for column in ['year', *METRICS] if column in frame})
+
+    def authorities(self):
+        rows = self._connection().execute(
+            'SELECT DISTINCT health_authority FROM wait_times WHERE detail '
+            'ORDER BY health_authority').fetchall()
+        return [authority for authority, in rows]
+
+    def years(self):
+        rows = self._connection().execute(
+            'SELECT DISTINCT year FROM wait_times ORDER BY year').fetchall()
+        return [year for year, in rows]
+
+    def hospitals(self, health_authority):
+        rows = self._connection().execute(
+            'SELECT DISTINCT hospital FROM wait_times '
+            'WHERE health_authority = ? AND detail ORDER BY hospital',
+            (health_authority,)).fetchall()
+        return [hospital for hospital, in rows]
+
+    def hospital_cells(self, health_authority, hospital, year):
+        return self._query(
+            'SELECT hospital, year, quarter, TOTAL(waiting) AS waiting, '
+            'TOTAL(completed) AS completed FROM wait_times '
+            'WHERE health_authority = ? AND hospital = ? AND detail '
+            'AND year BETWEEN ? AND ? GROUP BY year, quarter ORDER BY year, quarter',
+            (health_authority, hospital, *year))
+
+    def authority_cells(self, health_authority, year):
+        return self._query(
+            'SELECT health_authority, year, quarter, TOTAL(waiting) AS waiting, '
+            'TOTAL(completed) AS completed FROM wait_times '
+            'WHERE health_authority = ? AND detail AND year BETWEEN ? AND ? '
+            'GROUP BY year, quarter ORDER BY year, quarter',
+            (health_authority, *year))
+
+    def totals(self, health_authority, year):
+        waiting, completed, mean_50, mean_90 = self._connection().execute(
+            'SELECT TOTAL(waiting), TOTAL(completed), AVG(wait_time_50), '
+            'AVG(wait_time_90) FROM wait_times '
+            'WHERE health_authority = ? AND year BETWEEN ? AND ?',
+            (health_authority, *year)).fetchone()
+        return (waiting, completed, np.nan if mean_50 is None else mean_50,
+                np.nan if mean_90 is None else mean_90)
+
+    def ranked_procedures(self, health_authority, year, metric, k):
+        if metric not in METRICS:
+            raise ValueError(f'cannot rank by {metric!r}')
+        # means over the quarters of per-quarter means, like the cube's
+        means = self._query(
+            'SELECT procedure, ' +
+            ', '.join(f'AVG({value}) AS {value}' for value in METRICS) +
+            ' FROM (SELECT procedure, year, quarter, ' +
+            ', '.join(f'AVG({value}) AS {value}' for value in METRICS) +
+            ' FROM wait_times WHERE health_authority = ? AND analysed '
+            'AND year BETWEEN ? AND ? GROUP BY procedure, year, quarter) '
+            f'GROUP BY procedure HAVING COUNT({metric}) > 0 ORDER BY procedure',
+            (health_authority, *year))
+        values = means[metric].to_numpy(dtype='float64')
+        return (means.iloc[top_k(values, k)],
+                means.iloc[top_k(values, k, largest=True)])
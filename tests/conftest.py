@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the repository's modules, and the benchmarks' Dash client that drives
+# the callbacks in the tests too
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+os.environ.setdefault('DATA_WATCH_INTERVAL', '0')
+
+
+# dash_code imported as the server does, over the workbooks in data/
+@pytest.fixture(scope='session')
+def dash_code():
+    from dash_client import import_app
+    return import_app()
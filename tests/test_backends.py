@@ -0,0 +1,15 @@
+from backends import queries, same
+
+
+# every query of benchmarks/backends.py's grid, which also times them
+def test_sqlite_answers_as_the_cubes(dash_code):
+    answers = {}
+    for backend in ['cubes', 'sqlite']:
+        plots = dash_code.SurgicalPlots(store=dash_code.column_store, backend=backend)
+        answers[backend] = {(name, repr(args)): call()
+                            for name, args, call in queries(dash_code, plots)}
+
+    assert answers['cubes'].keys() == answers['sqlite'].keys()
+    differences = [key for key, answer in answers['cubes'].items()
+                   if not same(answer, answers['sqlite'][key])]
+    assert differences == []
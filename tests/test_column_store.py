@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+import column_store
+from column_store import ColumnStore
+
+
+def publish_release(store, line, release, years):
+    store.use_release(line, release)
+    for year in years:
+        store.publish(f'data-{release}-{year}', {'year': year},
+                      {'values': np.arange(3)}, release)
+
+
+def test_keeps_the_current_and_previous_release_of_each_line(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    publish_release(store, 'bc', 'r1', [2020, 2021])
+    publish_release(store, 'other', 'o1', [2021])
+    publish_release(store, 'bc', 'r2', [2020, 2021, 2022])
+    assert sorted(store.generations()) == [
+        'data-o1-2021', 'data-r1-2020', 'data-r1-2021',
+        'data-r2-2020', 'data-r2-2021', 'data-r2-2022']
+
+    publish_release(store, 'bc', 'r3', [2022])
+    # every partition of r1 goes, the other line keeps its only release
+    assert sorted(store.generations()) == [
+        'data-o1-2021', 'data-r2-2020', 'data-r2-2021', 'data-r2-2022', 'data-r3-2022']
+
+    # using a release again does not prune
+    store.use_release('bc', 'r3')
+    assert len(store.generations()) == 5
+    assert sorted(os.listdir(tmp_path))[0] == '.releases'
+
+
+def published(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    store.use_release('bc', 'r1')
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'n': len(builds)}, {'values': np.arange(len(builds))}
+
+    store.load('data-r1', build, 'r1')
+    return store, build
+
+
+def test_load_publishes_a_generation_pruned_meanwhile(tmp_path, monkeypatch):
+    store, build = published(tmp_path)
+    exists = store.exists
+
+    # another worker removes it right after this one found it
+    def exists_then_removed(name):
+        found = exists(name)
+        store.remove(name)
+        monkeypatch.setattr(store, 'exists', exists)
+        return found
+    monkeypatch.setattr(store, 'exists', exists_then_removed)
+
+    meta, arrays = store.load('data-r1', build, 'r1')
+    assert meta == {'n': 2} and list(arrays['values']) == [0, 1]
+
+
+def test_load_publishes_a_generation_pruned_while_attaching(tmp_path, monkeypatch):
+    store, build = published(tmp_path)
+    load = np.load
+
+    # removed after its meta.json was read, before its arrays were mapped
+    def removed_then_load(path, **kwargs):
+        store.remove('data-r1')
+        monkeypatch.setattr(column_store.np, 'load', load)
+        return load(path, **kwargs)
+    monkeypatch.setattr(column_store.np, 'load', removed_then_load)
+
+    meta, arrays = store.load('data-r1', build, 'r1')
+    assert meta == {'n': 2} and list(arrays['values']) == [0, 1]
+    assert store.generations() == ['data-r1']
+
+
+def test_a_generation_is_gone_before_its_files_are_deleted(tmp_path, monkeypatch):
+    store, _ = published(tmp_path)
+    rmtree = column_store.shutil.rmtree
+    exists = []
+
+    # while its files are deleted, one at a time, readers must not find it
+    def deleting(path, **kwargs):
+        exists.append(store.exists('data-r1'))
+        rmtree(path, **kwargs)
+    monkeypatch.setattr(column_store.shutil, 'rmtree', deleting)
+
+    store.remove('data-r1')
+    store.remove('data-r1')
+    assert exists == [False]
+    assert store.generations() == []
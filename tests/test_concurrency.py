@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from partitions import PartitionCache
+
+AUTHORITIES = ['Interior', 'Fraser', 'Provincial']
+YEARS = [[2017, 2022], [2009, 2022], [2021, 2021]]
+THREADS = 8
+
+
+def calls(dash_code, plots):
+    # (method, arguments) of the queries and chart renders a callback makes
+    for authority in AUTHORITIES:
+        health_authority = dash_code.authority_name(authority)
+        for year in YEARS:
+            yield plots.filtering, (authority, year)
+            yield plots.score_cards, (health_authority, year)
+            yield plots.data_compprop, (year, health_authority)
+            yield plots.comp_prop_plot, (year, health_authority)
+            yield plots.fastest_procedures, (health_authority, year)
+            yield plots.slowest_procedures, (health_authority, year)
+            for hospital in plots.hospitals(health_authority)[:2]:
+                yield plots.data_by_hosp, (health_authority, year, hospital)
+                yield plots.wait_complete_plot, (health_authority, year, hospital)
+
+
+def key(method, args):
+    return method.__name__, repr(args)
+
+
+def assert_same(a, b):
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, tuple):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_same(x, y)
+    else:
+        assert a == b
+
+
+def fresh_plots(dash_code, backend, max_partitions):
+    # nothing rendered or loaded yet, so every call does its own work
+    return dash_code.SurgicalPlots(store=dash_code.column_store, backend=backend,
+                                   partitions=PartitionCache(max_partitions))
+
+
+# the answers of each backend called one at a time
+@pytest.fixture(scope='module')
+def serial(dash_code):
+    answers = {}
+
+    def answer(backend):
+        if backend not in answers:
+            plots = fresh_plots(dash_code, backend, dash_code.MAX_PARTITIONS)
+            answers[backend] = {key(method, args): method(*args)
+                                for method, args in calls(dash_code, plots)}
+        return answers[backend]
+    return answer
+
+
+# 2 partitions for queries touching up to 14 years: threads evict the
+# partitions others are still reading
+@pytest.mark.parametrize('backend, max_partitions',
+                         [('cubes', 32), ('cubes', 2), ('sqlite', 32)])
+def test_parallel_callbacks_match_serial(dash_code, serial, backend, max_partitions):
+    plots = fresh_plots(dash_code, backend, max_partitions)
+    grid = list(calls(dash_code, plots))
+    # each call twice, so threads also race on the same chart
+    with ThreadPoolExecutor(THREADS) as pool:
+        futures = [(key(method, args), pool.submit(method, *args))
+                   for method, args in grid + grid]
+        results = [(name, future.result()) for name, future in futures]
+
+    expected = serial(backend)
+    for name, result in results:
+        assert_same(result, expected[name])
+    if backend == 'cubes' and max_partitions < len(dash_code.surgical_plots.data.years()):
+        assert plots.partitions.stats()['evictions'] > 0
@@ -0,0 +1,67 @@
+from openpyxl import Workbook
+
+from data_cache import build_cache, load_wait_times, read_cache, row_flags
+
+HEADER = ['FISCAL_YEAR', 'QUARTER', 'HEALTH_AUTHORITY', 'HOSPITAL_NAME', 'PROCEDURE_GROUP',
+          'WAITING', 'COMPLETED', 'COMPLETED_50TH_PERCENTILE', 'COMPLETED_90TH_PERCENTILE']
+ROWS = [
+    ['2021/22', 'Q1', 'Fraser', 'Burnaby Hospital', 'Hernia Surgery', 10, '<5', 2.1, 8.0],
+    ['2021/22', 'Q1', 'Fraser', None, 'Hernia Surgery', 4, 6, 3.0, 9.5],
+    ['2021/22', 'Q2', 'Fraser', 'Burnaby Hospital', None, 7, 8, None, None],
+    [None, 'Q2', 'Fraser', 'Burnaby Hospital', 'Hernia Surgery', 1, 1, 1.0, 1.0],
+]
+
+
+def saved(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in [HEADER] + rows:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def cached(tmp_path, rows):
+    path = saved(tmp_path / '2021_2022-quarterly-surgical_wait_times.xlsx', rows)
+    manifest = build_cache(path, str(tmp_path / 'cache'))
+    return manifest, read_cache(manifest, str(tmp_path / 'cache'))
+
+
+def test_empty_cells_stay_missing(tmp_path):
+    manifest, data = cached(tmp_path, ROWS)
+
+    # the row without a year is dropped, not a crash
+    assert data['year'].tolist() == [2021, 2021, 2021]
+    assert manifest['categories']['hospital'] == ['Burnaby Hospital']
+    assert manifest['categories']['procedure'] == ['Hernia Surgery']
+    assert data['hospital'].isna().tolist() == [False, True, False]
+    assert data['procedure'].isna().tolist() == [False, False, True]
+    assert data['completed_suppressed'].tolist() == [True, False, False]
+
+    detail, analysed = row_flags(data)
+    assert detail.tolist() == [True, False, False]
+    assert analysed.tolist() == [True, False, False]
+
+
+def test_columns_without_a_value(tmp_path):
+    manifest, data = cached(tmp_path, [ROWS[0][:3] + [None, None] + ROWS[0][5:]])
+    assert manifest['categories']['hospital'] == []
+    assert data['hospital'].isna().all() and data['procedure'].isna().all()
+
+
+def test_one_year_as_cut_from_every_year(tmp_path):
+    row = ['2020/21', 'Q4', 'Fraser', 'Burnaby Hospital', 'Hernia Surgery', 1, 1, 1.0, 1.0]
+    paths = [
+        saved(tmp_path / '2020_2021-q4-interim-quarterly-surgical_wait_times.xlsx',
+              [row, ROWS[0]]),
+        # the final release replaces the interim one's 2020/21 Q4
+        saved(tmp_path / '2020_2021-quarterly-surgical_wait_times.xlsx',
+              [row[:5] + [2, 2, 2.0, 2.0]]),
+    ]
+    cache_dir = str(tmp_path / 'cache')
+    data = load_wait_times(paths, cache_dir)
+    assert data['waiting'].tolist() == [10, 2]
+    for year in [2020, 2021]:
+        one = load_wait_times(paths, cache_dir, year=year)
+        assert one.astype(object).equals(
+            data[data['year'] == year].reset_index(drop=True).astype(object))
@@ -0,0 +1,21 @@
+from dash_client import INITIAL_STATE, callback_request, server_callbacks
+
+
+def test_get_answers_a_matching_etag_with_304(dash_code):
+    client = dash_code.server.test_client()
+    response = client.get('/_dash-layout')
+    etag = response.get_etag()[0]
+    assert response.status_code == 200 and etag
+    again = client.get('/_dash-layout', headers={'If-None-Match': f'"{etag}"'})
+    assert again.status_code == 304 and again.data == b''
+
+
+def test_callback_posts_are_not_tagged(dash_code):
+    client = dash_code.server.test_client()
+    key, entry = next((key, entry) for key, entry in server_callbacks(dash_code.app).items()
+                      if 'comp_prop_plot_id' in key)
+    body = callback_request(key, entry, dict(INITIAL_STATE), set())
+    response = client.post('/_dash-update-component', json=body,
+                           headers={'If-None-Match': '*'})
+    assert response.status_code == 200
+    assert response.get_etag() == (None, None)
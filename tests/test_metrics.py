@@ -0,0 +1,10 @@
+from metrics import Metrics
+from render_cache import RenderCache
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.add_cache('charts A "B"\\C\nD', RenderCache())
+    lines = [line for line in metrics.render().splitlines()
+             if line.startswith('render_cache_hits_total{')]
+    assert lines == ['render_cache_hits_total{cache="charts A \\"B\\"\\\\C\\nD"} 0']
@@ -0,0 +1,12 @@
+from pandas_passes import MAX_PASSES, replay
+
+
+# the consolidated callback slices the data once per interaction, so a
+# click costs a few pandas passes at most, not one per output
+def test_interactions_stay_within_the_pass_budget(dash_code):
+    rows = replay(dash_code)
+    assert [name for name, *_ in rows][0] == 'page load'
+    for name, requests, groupbys, filters in rows:
+        assert requests == 1, name
+        assert groupbys == 0, name
+        assert groupbys + filters <= MAX_PASSES, name
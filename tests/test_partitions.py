@@ -0,0 +1,48 @@
+import os
+
+from openpyxl import Workbook
+
+from column_store import ColumnStore
+from data_cache import cached_manifest
+from partitions import Jurisdiction, PartitionCache, PartitionedDataset
+
+HEADER = ['FISCAL_YEAR', 'QUARTER', 'HEALTH_AUTHORITY', 'HOSPITAL_NAME', 'PROCEDURE_GROUP',
+          'WAITING', 'COMPLETED', 'COMPLETED_50TH_PERCENTILE', 'COMPLETED_90TH_PERCENTILE']
+
+
+def save(path, waiting):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for year in ['2020/21', '2021/22']:
+        sheet.append([year, 'Q1', 'Fraser', 'Burnaby Hospital', 'Hernia Surgery',
+                      waiting, 1, 2.0, 3.0])
+    workbook.save(path)
+
+
+def test_years_load_the_workbooks_the_catalog_pinned(tmp_path, dash_code):
+    jurisdiction = Jurisdiction('Testland', str(tmp_path / 'data'), str(tmp_path / 'cache'))
+    os.makedirs(jurisdiction.data_dir)
+    path = os.path.join(jurisdiction.data_dir, '2021_2022-quarterly-surgical_wait_times.xlsx')
+    save(path, 10)
+    store = ColumnStore(str(tmp_path / 'store'))
+
+    def dataset():
+        return PartitionedDataset(jurisdiction, store, PartitionCache(),
+                                  dash_code.load_partition)
+
+    data = dataset()
+    assert data.totals('Fraser', [2020, 2020])[0] == 10
+
+    # a new release overwrites the workbook, and another worker reloading
+    # rebuilds its column cache, before this one queries another year
+    save(path, 99)
+    cached_manifest(path, jurisdiction.cache_dir)
+    assert data.totals('Fraser', [2021, 2021])[0] == 10
+    assert data.forecasts is not None
+
+    # the reload reads the new release, under its own digest
+    reloaded = dataset()
+    assert reloaded.digest != data.digest
+    assert reloaded.totals('Fraser', [2021, 2021])[0] == 99
+    assert data.totals('Fraser', [2020, 2021])[0] == 20
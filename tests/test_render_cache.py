@@ -0,0 +1,17 @@
+from render_cache import RenderCache
+
+
+def test_pinned_view_does_not_mix_generations():
+    cache = RenderCache()
+    cache.get_or_render('chart', lambda: 'old')
+    pinned = cache.pinned()
+    assert pinned.get_or_render('chart', lambda: 'unused') == 'old'
+
+    # a reload clears the cache while a callback still reads the old data
+    cache.clear()
+    cache.get_or_render('chart', lambda: 'new')
+    assert pinned.get_or_render('chart', lambda: 'old again') == 'old again'
+    assert cache.get_or_render('chart', lambda: 'unused') == 'new'
+
+    pinned.get_or_render('other', lambda: 'old')
+    assert cache.stats()['entries'] == 1